@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Cold vs warm request latency of the pooled ApiClient.
+
+Cold: a new client (and so a new connection) for every request, like the
+old bare requests.post(). Warm: one shared client that keeps its
+connections alive. Runs against an in-process mock endpoint by default:
+
+    python benchmarks/cold_warm.py -n 200
+    python benchmarks/cold_warm.py --url http://127.0.0.1:8766/v1/chat/completions  # python -m dobby mock
+
+Against localhost only the TCP connect is saved; against Fireworks the
+DNS lookup and TLS handshake are saved as well.
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rephrase_engine import ApiClient, LatencyStats
+from dobby import MockFireworksServer
+
+PAYLOAD = {"model": "mock", "messages": [{"role": "user", "content": "hello how are you"}], "max_tokens": 64}
+
+def start_mock(delay):
+    server = MockFireworksServer(("127.0.0.1", 0), delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+
+def post(client, url, headers):
+    response = client.post(url, PAYLOAD, headers=headers)
+    response.raise_for_status()
+    response.json()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--requests", type=int, default=100, help="Requests per mode")
+    parser.add_argument("--url", help="Chat completions URL (default: an in-process mock)")
+    parser.add_argument("--api-key", default="", help="Bearer token for a real endpoint")
+    parser.add_argument("--delay-ms", type=int, default=0, help="Response time of the in-process mock")
+    args = parser.parse_args(argv)
+    
+    server = None
+    url = args.url
+    if not url:
+        server, url = start_mock(args.delay_ms / 1000)
+    headers = {"Authorization": f"Bearer {args.api_key}"} if args.api_key else {}
+    latency = LatencyStats("Request latency")
+    
+    for _ in range(args.requests):
+        client = ApiClient(retries=0)
+        started = time.perf_counter()
+        post(client, url, headers)
+        latency.record("cold", time.perf_counter() - started)
+        client.close()
+    
+    client = ApiClient(retries=0)
+    post(client, url, headers)  # Open the connection once
+    for _ in range(args.requests):
+        started = time.perf_counter()
+        post(client, url, headers)
+        latency.record("warm", time.perf_counter() - started)
+    client.close()
+    
+    for name in ("cold", "warm"):
+        row = latency.percentiles(name)
+        print(f"{name}: p50 {row[50]:.2f} ms, p90 {row[90]:.2f} ms, p99 {row[99]:.2f} ms")
+    if server:
+        server.shutdown()
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Thread-per-request vs the engine loop under concurrent rephrases.
+
+Threads: a new thread per rephrase, each calling RephraseEngine.rephrase()
+on one shared engine, like the window did before the engine loop. Engine
+loop: every rephrase queued with RephraseEngine.submit(), which runs at
+most max_concurrent at once. Each round sends N rephrases at the same time
+and times until the last one is back; the median of a few rounds is shown.
+Runs against an in-process mock endpoint by default:
+
+    python benchmarks/threads_vs_async.py
+    python benchmarks/threads_vs_async.py -c 1 8 64 256 --delay-ms 200
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rephrase_engine import RephraseEngine
+from dobby import MockFireworksServer
+
+def start_mock(delay):
+    server = MockFireworksServer(("127.0.0.1", 0), delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+
+def with_threads(engine, texts):
+    threads = [threading.Thread(target=engine.rephrase, args=(text, "friendly"), kwargs={"bypass_cache": True})
+               for text in texts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def with_engine_loop(engine, texts):
+    futures = [engine.submit(text, "friendly", bypass_cache=True) for text in texts]
+    for future in futures:
+        future.result()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-c", "--concurrent", type=int, nargs="+", default=[1, 8, 64],
+                        help="Rephrases sent at once, one round per value")
+    parser.add_argument("-r", "--rounds", type=int, default=3, help="Rounds per value (the median is shown)")
+    parser.add_argument("--url", help="Chat completions URL (default: an in-process mock)")
+    parser.add_argument("--api-key", default="mock-key-0123456789", help="Bearer token for a real endpoint")
+    parser.add_argument("--delay-ms", type=int, default=50, help="Response time of the in-process mock")
+    parser.add_argument("--max-concurrent", type=int, default=8, help="Engine loop limit (NETWORK_SETTINGS)")
+    args = parser.parse_args(argv)
+    
+    server = None
+    url = args.url
+    if not url:
+        server, url = start_mock(args.delay_ms / 1000)
+    engine = RephraseEngine(api_key=args.api_key, url=url, cache_settings={"path": ""},
+                            network_settings={"stream": False, "retries": 0, "timeout": 60,
+                                              "max_concurrent": args.max_concurrent})
+    engine.rephrase("warm up", "friendly")  # Open the connection and start the loop once
+    
+    print(f"{'concurrent':>10}  {'thread-per-request':>18}  {'engine loop':>11}")
+    for count in args.concurrent:
+        results = []
+        for run in (with_threads, with_engine_loop):
+            times = []
+            for round_ in range(args.rounds):
+                texts = [f"{run.__name__} {count} {round_} {n}" for n in range(count)]
+                started = time.perf_counter()
+                run(engine, texts)
+                times.append((time.perf_counter() - started) * 1000)
+            results.append(statistics.median(times))
+        print(f"{count:>10}  {results[0]:>15.0f} ms  {results[1]:>8.0f} ms")
+    
+    engine.close()
+    if server:
+        server.shutdown()
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,12 +4,15 @@ FIREWORKS_URL = "https://api.fireworks.ai/inference/v1/chat/completions"
 MODEL_NAME = "accounts/fireworks/models/llama-v3p1-70b-instruct"
 
 # 6 Writing Styles with Enhanced Prompts
+# "system"  - fixed instructions, sent first so Fireworks can cache them
+# "compact" - short instructions used for very short inputs
+# "prompt"  - per-request message, {input_text} is replaced with your text
 WRITING_STYLES = {
     "friendly": {
         "name": "🟡 Friendly & Human",
         "emoji": "😊",
         "color": "#FFC107",
-        "prompt": """TASK: Rewrite text to sound friendly and warm, but not overly sweet or fake.
+        "system": """TASK: Rewrite text to sound friendly and warm, but not overly sweet or fake.
 
 STYLE: Naturally friendly and warm - like talking to a nice colleague or friend who is genuinely helpful.
 
@@ -83,8 +86,16 @@ NOT: "I'm doing great, thanks for asking!"
 Input: "📺Используйте страну - нидерланды"
 Friendly rephrase: "📺Попробуйте использовать страну - нидерланды" 
 NOT: "I can help you with countries. Let me suggest Netherlands!"
+""",
+        "compact": """TASK: Rewrite the text to sound friendly and warm, but not overly sweet or fake.
 
-INPUT TEXT TO REPHRASE: {input_text}
+RULES:
+- Keep the exact meaning, direction and language of the original
+- Keep line breaks, bullet points and spacing
+- Do NOT add sentences, questions, explanations or emojis
+- Do NOT answer the text - only rephrase it
+- Reply with the rephrased text only""",
+        "prompt": """INPUT TEXT TO REPHRASE: {input_text}
 
 REPHRASED VERSION:"""
     },
@@ -92,7 +103,7 @@ REPHRASED VERSION:"""
         "name": "🔵 Professional & Human",
         "emoji": "💼",
         "color": "#2196F3",
-        "prompt": """TASK: Rewrite text in formal business language suitable for corporate communications.
+        "system": """TASK: Rewrite text in formal business language suitable for corporate communications.
 
 STYLE: Formal, authoritative, business-appropriate - like a senior executive or professional consultant writing to colleagues.
 
@@ -157,8 +168,16 @@ NOT: "I'm doing great, thanks for asking!"
 Input: "📺Используйте страну - нидерланды"
 Friendly rephrase: "📺Попробуйте использовать страну - нидерланды" 
 NOT: "I can help you with countries. Let me suggest Netherlands!"
+""",
+        "compact": """TASK: Rewrite the text in clear, formal business language. No contractions, no casual words.
 
-INPUT TEXT TO REPHRASE: {input_text}
+RULES:
+- Keep the exact meaning, direction and language of the original
+- Keep line breaks, bullet points and spacing
+- Do NOT add sentences, questions, explanations or emojis
+- Do NOT answer the text - only rephrase it
+- Reply with the rephrased text only""",
+        "prompt": """INPUT TEXT TO REPHRASE: {input_text}
 
 REPHRASED VERSION:"""
     },
@@ -166,7 +185,7 @@ REPHRASED VERSION:"""
         "name": "🟣 Polite & Respectful",
         "emoji": "🙏",
         "color": "#9C27B0",
-        "prompt": """TASK: Rewrite text with utmost courtesy and respect, as if addressing someone you deeply respect.
+        "system": """TASK: Rewrite text with utmost courtesy and respect, as if addressing someone you deeply respect.
 
 STYLE: Highly polite, deferential, respectful - like addressing a respected superior, elder, or esteemed colleague.
 
@@ -235,8 +254,16 @@ NOT: "I'm doing great, thanks for asking!"
 Input: "📺Используйте страну - нидерланды"
 Friendly rephrase: "📺Попробуйте использовать страну - нидерланды" 
 NOT: "I can help you with countries. Let me suggest Netherlands!"
+""",
+        "compact": """TASK: Rewrite the text with courtesy and respect, using simple polite words. No commands or demands.
 
-INPUT TEXT TO REPHRASE: {input_text}
+RULES:
+- Keep the exact meaning, direction and language of the original
+- Keep line breaks, bullet points and spacing
+- Do NOT add sentences, questions, explanations or emojis
+- Do NOT answer the text - only rephrase it
+- Reply with the rephrased text only""",
+        "prompt": """INPUT TEXT TO REPHRASE: {input_text}
 
 REPHRASED VERSION:"""
     },
@@ -244,7 +271,7 @@ REPHRASED VERSION:"""
         "name": "🟢 Casual & Conversational",
         "emoji": "💬",
         "color": "#4CAF50",
-        "prompt": """TASK: Rewrite text like you're chatting with a close friend or colleague in a relaxed setting.
+        "system": """TASK: Rewrite text like you're chatting with a close friend or colleague in a relaxed setting.
 
 STYLE: Casual, relaxed, conversational - like talking to someone you're comfortable with in a coffee shop or group chat.
 
@@ -313,8 +340,16 @@ NOT: "I'm doing great, thanks for asking!"
 Input: "📺Используйте страну - нидерланды"
 Friendly rephrase: "📺Попробуйте использовать страну - нидерланды" 
 NOT: "I can help you with countries. Let me suggest Netherlands!"
+""",
+        "compact": """TASK: Rewrite the text in a relaxed, conversational tone, like chatting with a friend.
 
-INPUT TEXT TO REPHRASE: {input_text}
+RULES:
+- Keep the exact meaning, direction and language of the original
+- Keep line breaks, bullet points and spacing
+- Do NOT add sentences, questions, explanations or emojis
+- Do NOT answer the text - only rephrase it
+- Reply with the rephrased text only""",
+        "prompt": """INPUT TEXT TO REPHRASE: {input_text}
 
 REPHRASED VERSION:"""
     },
@@ -322,7 +357,7 @@ REPHRASED VERSION:"""
         "name": "🔥 Supportive & Human",
         "emoji": "💪",
         "color": "#FF5722",
-        "prompt": """TASK: Rewrite text with genuine encouragement and support, like a caring friend who believes in you.
+        "system": """TASK: Rewrite text with genuine encouragement and support, like a caring friend who believes in you.
 
 STYLE: Supportive, encouraging, uplifting - like a trusted friend or mentor who wants to help you succeed.
 
@@ -387,8 +422,16 @@ NOT: "I'm doing great, thanks for asking!"
 Input: "📺Используйте страну - нидерланды"
 Friendly rephrase: "📺Попробуйте использовать страну - нидерланды" 
 NOT: "I can help you with countries. Let me suggest Netherlands!"
+""",
+        "compact": """TASK: Rewrite the text to sound encouraging and supportive, like a caring friend.
 
-INPUT TEXT TO REPHRASE: {input_text}
+RULES:
+- Keep the exact meaning, direction and language of the original
+- Keep line breaks, bullet points and spacing
+- Do NOT add sentences, questions, explanations or emojis
+- Do NOT answer the text - only rephrase it
+- Reply with the rephrased text only""",
+        "prompt": """INPUT TEXT TO REPHRASE: {input_text}
 
 REPHRASED VERSION:"""
     },
@@ -396,7 +439,7 @@ REPHRASED VERSION:"""
         "name": "🔥 Unhinged & Rude",
         "emoji": "💀",
         "color": "#E91E63",
-        "prompt": """TASK: Rewrite text as an absolutely unhinged, rude person with zero filter - aggressive but still understandable.
+        "system": """TASK: Rewrite text as an absolutely unhinged, rude person with zero filter - aggressive but still understandable.
 
 STYLE: Completely unhinged and rude - like an angry person online who says exactly what they think without caring about anyone's feelings.
 
@@ -467,8 +510,16 @@ NOT: "fuck off with the small talk, who gives a shit!"
 Input: "hello i am pidoras how are you doing"
 Unhinged rephrase: "sup i'm a fucking pidoras, how the hell are you doing?"
 NOT: "fuck off with the small talk, who gives a shit, i'm doing whatever the hell i want"
+""",
+        "compact": """TASK: Rewrite the text as a rude person with zero filter - simple harsh words and swearing, but still understandable.
 
-INPUT TEXT TO REPHRASE: {input_text}
+RULES:
+- Keep the exact meaning, direction and language of the original
+- Keep line breaks, bullet points and spacing
+- Do NOT add sentences, questions, explanations or emojis
+- Do NOT answer the text - only rephrase it
+- Reply with the rephrased text only""",
+        "prompt": """INPUT TEXT TO REPHRASE: {input_text}
 
 REPHRASED VERSION (BE ABSOLUTELY RUDE):"""
     }
@@ -483,3 +534,108 @@ API_SETTINGS = {
     "frequency_penalty": 0,
     "temperature": 0.2,
 }
+
+# Network Settings
+NETWORK_SETTINGS = {
+    "timeout": 30,
+    "pool_size": 10,       # Keep-alive connections kept open to Fireworks
+    "http2": False,        # Needs: pip install httpx[http2]
+    "stream": True,        # Show the result word by word as it is generated
+    "stream_refresh_ms": 50,
+    "retries": 3,          # Retries for network errors, 429 and 5xx
+    "backoff_base": 0.5,   # Seconds, doubled every retry (with jitter)
+    "backoff_max": 8,
+    "breaker_threshold": 5,  # Failures in a row before pausing requests
+    "breaker_cooldown": 30,  # Seconds to pause before trying again
+    "requests_per_minute": 0,  # Account limits, 0 = learn from response headers
+    "tokens_per_minute": 0,
+    "max_concurrent": 8,   # Requests in flight at once, all windows and modes together
+    "reserved_interactive": 1,  # Of those, kept free for rephrases you are waiting on
+}
+
+# Prompt Settings
+PROMPT_SETTINGS = {
+    "compact_max_words": 12,  # Inputs this short use the style's "compact" instructions
+    # Output budget = input tokens x output_ratio (a style can set its own
+    # "output_ratio"), at least output_min_tokens, at most API max_tokens
+    "output_ratio": 2.5,
+    "output_min_tokens": 64,
+    # Generation stops here - catches notes and explanations after the rephrase
+    "stop": ["\n\nINPUT TEXT TO REPHRASE", "\n\nNote:", "\n\n(Note", "\n\nExplanation:"],
+}
+
+# Long Texts - rephrased in parts, several at the same time
+CHUNK_SETTINGS = {
+    "enabled": True,
+    "min_chars": 1500,     # Texts at least this long are split
+    "chunk_chars": 800,    # Target size of each part
+    "context_chars": 200,  # Neighbouring text sent along with each part
+    "max_workers": 4,
+}
+
+# Compare Mode - rephrase the text in several styles at once
+COMPARE_SETTINGS = {
+    "enabled": False,      # Shows a "Compare" button next to Generate
+    "styles": [],          # Styles to compare, empty = all of them
+}
+
+# Response Cache - repeated texts come back instantly without an API call
+CACHE_SETTINGS = {
+    "enabled": True,
+    "path": "dobby_cache.db",  # SQLite file, empty = memory only
+    "memory_items": 200,
+    "max_entries": 5000,
+    "ttl_days": 30,
+}
+
+# Clipboard - F2 sends Ctrl+C and waits for the clipboard to change, Paste sends Ctrl+V
+CLIPBOARD_SETTINGS = {
+    "copy_timeout_ms": 500,  # Give up waiting after this and read the clipboard anyway
+    "restore": True,         # Put back what was on the clipboard before F2 / Paste
+    "restore_delay_ms": 500, # After Paste, give the other app time to read the result first
+}
+
+# Hotkeys - only these combinations are registered, other keys never reach Dobby
+HOTKEY_SETTINGS = {
+    "capture": "<f2>",     # Copy the selection and open Dobby, e.g. "<ctrl>+<alt>+r"
+    "close_window": "Esc", # Only works while the Dobby window is focused
+    "debounce_ms": 300,    # Repeated presses within this time count as one
+}
+
+# Keyboard Input - how Dobby sends Ctrl+C / Ctrl+V to other apps
+INPUT_SETTINGS = {
+    "backend": "pynput",     # "pynput" or "pyautogui"
+    "focus_timeout_ms": 500, # Paste waits at most this long for your app to get focus back
+}
+
+# Prefetch - start rephrasing in your last style as soon as F2 captures text,
+# so Generate is instant when you keep that style. Costs tokens when you don't.
+PREFETCH_SETTINGS = {
+    "enabled": False,
+    "max_chars": 2000,              # Longer captures are never prefetched
+    "max_tokens_per_hour": 20000,   # Spend cap for prefetching (estimated tokens)
+}
+
+# Alternatives - after a result is shown, one background request asks for a few
+# more versions so "Again" can show the next one instantly. Costs tokens on
+# every result, even when you never press Again.
+ALTERNATIVES_SETTINGS = {
+    "enabled": False,
+    "count": 2,            # Versions per request (the API's n) - each costs output tokens
+    "temperature": 0.8,    # Higher than API_SETTINGS so the versions actually differ
+}
+
+# Live Preview - regenerate the current style when you pause while editing the text
+LIVE_PREVIEW_SETTINGS = {
+    "enabled": False,
+    "delay_ms": 800,        # Pause in typing before a preview is generated
+    "min_chars": 3,         # Don't preview shorter texts
+    "max_per_minute": 6,    # Previews beyond this wait for the next free slot
+}
+
+# Sentence Cache - remembers rephrased sentences (greetings, sign-offs, policy
+# lines) per style; only sentences it hasn't seen go to the model, in one request
+SEGMENT_CACHE_SETTINGS = {
+    "enabled": False,
+    "min_segments": 2,      # Shorter texts are rephrased as a whole
+}
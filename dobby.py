@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+"""
+Dobby command line tools - no GUI needed.
+
+    python -m dobby batch macros/ --style professional -o macros.jsonl
+    python -m dobby batch tickets.jsonl --field body --style polite -o out.jsonl
+
+batch rephrases text files, directories of them, or one field of every
+JSONL record. Results are appended to the output as JSONL while the run
+goes, and every finished item is recorded in a journal next to it, so
+running the same command again after a crash skips what is already done
+instead of paying for it twice.
+
+    python -m dobby serve --port 8765
+
+serve answers POST /rephrase {"text": ..., "style": ...} for other local
+tools, plus POST /rephrase/stream (server-sent events), GET /styles and
+GET /stats. `python -m dobby mock` runs a fake Fireworks endpoint to load
+test it against (serve --upstream http://127.0.0.1:8766).
+
+    python -m dobby prompt-report [--live]
+
+prompt-report prints the prompt tokens of every style; --live also sends
+them to Fireworks and prints the latency and reported usage.
+"""
+import os
+import sys
+import json
+import re
+import time
+import hashlib
+import argparse
+from concurrent.futures import wait, FIRST_COMPLETED
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from rephrase_engine import (RephraseEngine, Generation, GenerationCancelled, ApiError, LatencyStats,
+                             PRIORITY_BATCH, WRITING_STYLES, NETWORK_SETTINGS, prompt_report)
+
+TEXT_PATTERNS = (".txt", ".md")
+
+def get_field(record, field):
+    """Value at a dotted path like "macro.body", or None"""
+    for name in field.split("."):
+        if not isinstance(record, dict):
+            return None
+        record = record.get(name)
+    return record
+
+def iter_jsonl(path, field):
+    """(id, text) for every record that has text in the field - one line at a time"""
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"⚠️ {path}:{line_number}: not JSON ({e})", file=sys.stderr)
+                continue
+            text = get_field(record, field)
+            if isinstance(text, str) and text.strip():
+                record_id = record.get("id") if isinstance(record, dict) else None
+                yield f"{path}:{record_id if record_id is not None else line_number}", text
+
+def iter_inputs(paths, field, patterns=TEXT_PATTERNS):
+    """(id, text) for everything to rephrase, read lazily in a stable order"""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(patterns):
+                        yield from iter_inputs([os.path.join(root, name)], field, patterns)
+        elif path.lower().endswith(".jsonl"):
+            yield from iter_jsonl(path, field)
+        else:
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+            if text.strip():
+                yield path, text
+
+def journal_key(item_id, style, text):
+    """Identifies one finished item - changes if its text or style changes"""
+    return hashlib.sha256(f"{item_id}\0{style}\0{text}".encode("utf-8")).hexdigest()
+
+def load_journal(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+def run_batch(args):
+    if args.style not in WRITING_STYLES:
+        print(f"❌ Unknown style '{args.style}' - choose from: {', '.join(WRITING_STYLES)}", file=sys.stderr)
+        return 2
+    
+    concurrency = args.concurrency or NETWORK_SETTINGS.get("max_concurrent", 8)
+    engine = RephraseEngine(api_key=args.api_key, url=args.upstream,
+                            network_settings={**NETWORK_SETTINGS, "max_concurrent": concurrency,
+                                              "reserved_interactive": 0})  # Nothing interactive to wait for
+    if not engine.has_api_key:
+        print("❌ Please configure API key in config.py", file=sys.stderr)
+        return 2
+    
+    journal_path = args.journal or f"{args.output}.journal"
+    done_keys = load_journal(journal_path)
+    if done_keys:
+        print(f"🔁 Resuming - {len(done_keys)} items already done", file=sys.stderr)
+    
+    counts = {"done": 0, "skipped": 0, "failed": 0}
+    pending = {}  # future -> (id, text, key)
+    
+    with open(args.output, "a", encoding="utf-8") as output, open(journal_path, "a", encoding="utf-8") as journal:
+        def finish(future):
+            item_id, text, key = pending.pop(future)
+            try:
+                record = {"id": item_id, "style": args.style, "input": text, "output": future.result()}
+            except Exception as e:
+                counts["failed"] += 1
+                print(f"⚠️ {item_id}: {e}", file=sys.stderr)
+                return
+            # Output first, then the journal - a crash in between repeats one item, never loses it
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+            journal.write(key + "\n")
+            journal.flush()
+            counts["done"] += 1
+            if counts["done"] % 10 == 0:
+                print(f"✅ {counts['done']} done, {len(pending)} running", file=sys.stderr)
+        
+        try:
+            for item_id, text in iter_inputs(args.inputs, args.field):
+                key = journal_key(item_id, args.style, text)
+                if key in done_keys:
+                    counts["skipped"] += 1
+                    continue
+                # Keep only a window of work in flight so big inputs are never held in memory
+                while len(pending) >= concurrency * 2:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        finish(future)
+                future = engine.submit(text, args.style, priority=PRIORITY_BATCH, stream=False)
+                pending[future] = (item_id, text, key)
+            
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    finish(future)
+        except KeyboardInterrupt:
+            print("🛑 Stopped - run the same command again to continue", file=sys.stderr)
+            for future in pending:
+                future.cancel()
+            return 130
+        finally:
+            engine.close()
+    
+    print(f"✅ {counts['done']} rephrased, {counts['skipped']} already done, {counts['failed']} failed "
+          f"-> {args.output}", file=sys.stderr)
+    return 1 if counts["failed"] else 0
+
+class RephraseHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "Dobby"
+    disable_nagle_algorithm = True  # Headers and body go out in separate writes
+    
+    def log_message(self, format, *args):
+        pass  # one line per request is too much under load - see GET /stats
+    
+    def send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def send_event(self, body):
+        self.wfile.write(f"data: {json.dumps(body, ensure_ascii=False)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+    
+    def read_request(self):
+        """(text, style, bypass_cache) from the JSON body, or None after answering 400"""
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except ValueError:
+            self.send_json(400, {"error": "Body must be JSON"})
+            return None
+        text = body.get("text") if isinstance(body, dict) else None
+        style = body.get("style", "friendly") if isinstance(body, dict) else None
+        if not isinstance(text, str) or not text.strip():
+            self.send_json(400, {"error": "\"text\" is required"})
+            return None
+        if style not in self.server.engine.styles:
+            self.send_json(400, {"error": f"Unknown style, choose from: {', '.join(self.server.engine.styles)}"})
+            return None
+        return text, style, bool(body.get("bypass_cache"))
+    
+    def do_GET(self):
+        started = time.monotonic()
+        route = self.path.split("?")[0]
+        if route == "/styles":
+            self.send_json(200, {key: style["name"] for key, style in self.server.engine.styles.items()})
+        elif route == "/stats":
+            self.send_json(200, self.server.stats())
+        else:
+            self.send_json(404, {"error": "Not found"})
+            return
+        self.server.latency.record(f"GET {route}", time.monotonic() - started)
+    
+    def do_POST(self):
+        started = time.monotonic()
+        route = self.path.split("?")[0]
+        if route == "/rephrase":
+            handled = self.rephrase()
+        elif route == "/rephrase/stream":
+            handled = self.rephrase_stream()
+        else:
+            self.send_json(404, {"error": "Not found"})
+            return
+        # Rejected requests are counted apart so they don't pull the rephrase percentiles down
+        self.server.latency.record(f"POST {route}" if handled else f"POST {route} (400)", time.monotonic() - started)
+    
+    def rephrase(self):
+        """Answer one rephrase; False if the request was rejected"""
+        request = self.read_request()
+        if not request:
+            return False
+        text, style, bypass_cache = request
+        try:
+            self.send_json(200, {"text": self.server.rephrase(text, style, bypass_cache).result(), "style": style})
+        except ApiError as e:
+            self.send_json(502, {"error": str(e)})
+        except Exception as e:
+            self.send_json(500, {"error": f"Error: {e}"})
+        return True
+    
+    def rephrase_stream(self):
+        """Server-sent events: {"delta"} while generating, then the final {"text"} and [DONE]"""
+        request = self.read_request()
+        if not request:
+            return False
+        text, style, bypass_cache = request
+        
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        
+        generation = Generation()
+        streamed = []
+        
+        def send_delta(delta):
+            try:
+                self.send_event({"delta": delta})
+                streamed.append(delta)
+            except OSError:
+                generation.cancel()  # client went away - stop paying for the rest
+        
+        future = self.server.engine.submit(text, style, generation=generation, bypass_cache=bypass_cache,
+                                           stream=True, on_delta=send_delta)
+        try:
+            result = future.result()
+            # The engine keeps the last batch for its return value - send whatever wasn't streamed yet.
+            # Cache hits and fallbacks arrive in one piece.
+            sent = "".join(streamed).lstrip()
+            if result.startswith(sent) and len(result) > len(sent):
+                self.send_event({"delta": result[len(sent):]})
+            self.send_event({"text": result, "style": style})
+            self.wfile.write(b"data: [DONE]\n\n")
+        except GenerationCancelled:
+            pass
+        except OSError:
+            generation.cancel()
+        except Exception as e:
+            try:
+                self.send_event({"error": str(e)})
+            except OSError:
+                pass
+        return True
+
+class RephraseServer(ThreadingHTTPServer):
+    """Local rephrase service - every request shares one engine.
+    
+    Its pooled client, cache and single-flight layer are shared too, so
+    identical requests in flight cost one Fireworks call.
+    """
+    daemon_threads = True
+    request_queue_size = 128  # the socketserver default of 5 resets connections under load
+    
+    def __init__(self, address, engine):
+        super().__init__(address, RephraseHandler)
+        self.engine = engine
+        self.latency = LatencyStats("Routes")
+    
+    def rephrase(self, text, style, bypass_cache=False):
+        """Future with the rephrased text"""
+        return self.engine.submit(text, style, bypass_cache=bypass_cache, stream=False)
+    
+    def stats(self):
+        return {"routes": self.latency.summary(),
+                "engine": [source.stats_text() for source in self.engine.stats_sources() if source]}
+
+def run_serve(args):
+    network_settings = dict(NETWORK_SETTINGS)
+    if args.concurrency:
+        network_settings["max_concurrent"] = args.concurrency
+    engine = RephraseEngine(api_key=args.api_key, url=args.upstream, network_settings=network_settings)
+    if not engine.has_api_key:
+        print("❌ Please configure API key in config.py", file=sys.stderr)
+        return 2
+    
+    server = RephraseServer((args.host, args.port), engine)
+    print(f"🌐 Dobby listening on http://{args.host}:{server.server_address[1]} "
+          f"(POST /rephrase, POST /rephrase/stream, GET /styles, GET /stats)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("🛑 Stopped", file=sys.stderr)
+    finally:
+        server.server_close()
+        engine.close()
+        print(server.latency.stats_text(), file=sys.stderr)
+    return 0
+
+def run_prompt_report(args):
+    engine = RephraseEngine(api_key=args.api_key, url=args.upstream)
+    if args.live and not engine.has_api_key:
+        print("❌ Please configure API key in config.py", file=sys.stderr)
+        return 2
+    try:
+        prompt_report(engine, live=args.live)
+    finally:
+        engine.close()
+    return 0
+
+class MockFireworksHandler(BaseHTTPRequestHandler):
+    """Answers chat completions like Fireworks, without a model or a key"""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # Headers and body go out in separate writes
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        prompt = payload.get("messages", [{}])[-1].get("content", "")
+        match = re.search(r"INPUT TEXT TO REPHRASE:\s*(.*?)\s*REPHRASED VERSION:", prompt, re.DOTALL)
+        source = match.group(1) if match else prompt
+        numbered = re.findall(r"^\[(\d+)\] (.*)$", source, re.MULTILINE)  # Sentence cache requests
+        reply = "\n".join(f"[{number}] Rephrased: {line}" for number, line in numbered) or f"Rephrased: {source}"
+        time.sleep(self.server.delay)
+        
+        if not payload.get("stream"):
+            replies = [reply] + [f"{reply} ({index + 1})" for index in range(1, payload.get("n", 1))]
+            data = json.dumps({"choices": [{"index": index, "message": {"role": "assistant", "content": text},
+                                            "finish_reason": "stop"} for index, text in enumerate(replies)],
+                               "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(reply) // 4}})
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data.encode("utf-8"))))
+            self.end_headers()
+            self.wfile.write(data.encode("utf-8"))
+            return
+        
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for word in re.findall(r"\S+\s*", reply):
+            chunk = {"choices": [{"delta": {"content": word}, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        done = {"choices": [{"delta": {}, "finish_reason": "stop"}]}
+        self.wfile.write(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+
+class MockFireworksServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+    
+    def __init__(self, address, delay):
+        super().__init__(address, MockFireworksHandler)
+        self.delay = delay
+
+def run_mock(args):
+    server = MockFireworksServer((args.host, args.port), args.delay_ms / 1000)
+    print(f"🧪 Mock Fireworks on http://{args.host}:{server.server_address[1]} "
+          f"({args.delay_ms} ms per response)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("🛑 Stopped", file=sys.stderr)
+    finally:
+        server.server_close()
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m dobby", description="Dobby AI Rephraser command line tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    batch = commands.add_parser("batch", help="Rephrase text files, directories or JSONL records")
+    batch.add_argument("inputs", nargs="+", help="Text files, directories (*.txt, *.md) or .jsonl files")
+    batch.add_argument("-s", "--style", required=True, help=f"One of: {', '.join(WRITING_STYLES)}")
+    batch.add_argument("-o", "--output", required=True, help="JSONL file results are appended to")
+    batch.add_argument("-f", "--field", default="text", help="JSONL field to rephrase, dots for nested (default: text)")
+    batch.add_argument("-c", "--concurrency", type=int, default=0,
+                       help="Requests at the same time (default: NETWORK_SETTINGS max_concurrent)")
+    batch.add_argument("--journal", help="Progress journal (default: <output>.journal)")
+    batch.add_argument("--upstream", help="Chat completions URL (default: FIREWORKS_URL from config.py)")
+    batch.add_argument("--api-key", help="Fireworks API key (default: FIREWORKS_API_KEY from config.py)")
+    batch.set_defaults(run=run_batch)
+    
+    serve = commands.add_parser("serve", help="Local HTTP rephrase service for other tools")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("-c", "--concurrency", type=int, default=0,
+                       help="Upstream requests at the same time (default: NETWORK_SETTINGS max_concurrent)")
+    serve.add_argument("--upstream", help="Chat completions URL (default: FIREWORKS_URL from config.py)")
+    serve.add_argument("--api-key", help="Fireworks API key (default: FIREWORKS_API_KEY from config.py)")
+    serve.set_defaults(run=run_serve)
+    
+    mock = commands.add_parser("mock", help="Fake Fireworks endpoint for load testing serve and batch")
+    mock.add_argument("--host", default="127.0.0.1")
+    mock.add_argument("--port", type=int, default=8766)
+    mock.add_argument("--delay-ms", type=int, default=300, help="Time each response takes")
+    mock.set_defaults(run=run_mock)
+    
+    report = commands.add_parser("prompt-report", help="Prompt tokens per style, and latency with --live")
+    report.add_argument("--live", action="store_true", help="Also send every prompt and print latency and usage")
+    report.add_argument("--upstream", help="Chat completions URL (default: FIREWORKS_URL from config.py)")
+    report.add_argument("--api-key", help="Fireworks API key (default: FIREWORKS_API_KEY from config.py)")
+    report.set_defaults(run=run_prompt_report)
+    
+    args = parser.parse_args(argv)
+    return args.run(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,10 @@
 #!/usr/bin/env python3
 import sys
 import os
-import json
 import time
 import threading
-import requests
+from functools import partial
+from collections import deque
 import pyperclip
 import pyautogui
 from pynput import keyboard
@@ -18,6 +18,9 @@ from PyQt6.QtWidgets import *
 from PyQt6.QtCore import *
 from PyQt6.QtGui import *
 
+from rephrase_engine import (RephraseEngine, Generation, GenerationCancelled, ApiError, LatencyStats,
+                             PRIORITY_BACKGROUND, approx_tokens, estimate_tokens, prompt_report)
+
 class GradientLabel(QLabel):
     def __init__(self, text1, text2, color1="#1F1F1F", color2="#4F8CFF", parent=None):
         super().__init__(parent)
@@ -85,29 +88,225 @@ except ImportError:
     WRITING_STYLES = {}
     API_SETTINGS = {}
 
+# Optional settings - older config.py files may not have them yet
+try:
+    from config import COMPARE_SETTINGS
+except ImportError:
+    COMPARE_SETTINGS = {}
+
+try:
+    from config import CLIPBOARD_SETTINGS
+except ImportError:
+    CLIPBOARD_SETTINGS = {}
+
+try:
+    from config import HOTKEY_SETTINGS
+except ImportError:
+    HOTKEY_SETTINGS = {}
+
+try:
+    from config import INPUT_SETTINGS
+except ImportError:
+    INPUT_SETTINGS = {}
+
+try:
+    from config import PREFETCH_SETTINGS
+except ImportError:
+    PREFETCH_SETTINGS = {}
+
+try:
+    from config import ALTERNATIVES_SETTINGS
+except ImportError:
+    ALTERNATIVES_SETTINGS = {}
+
+try:
+    from config import LIVE_PREVIEW_SETTINGS
+except ImportError:
+    LIVE_PREVIEW_SETTINGS = {}
+
+class Prefetch:
+    """A generation started speculatively on capture, before Generate.
+    
+    Its chunks and result are held here until Generate adopts it (same text
+    and style) or it is discarded. Only touched on the GUI thread.
+    """
+    def __init__(self, text, style, generation, prompt_tokens):
+        self.text = text
+        self.style = style
+        self.generation = generation
+        self.prompt_tokens = prompt_tokens
+        self.started = time.monotonic()
+        self.parts = []
+        self.result = None
+        self.error = None
+    
+    def spent_tokens(self):
+        """Estimated tokens paid for so far - nothing if the cache answered"""
+        if self.generation.from_cache:
+            return 0
+        return self.prompt_tokens + approx_tokens(self.result if self.result is not None else "".join(self.parts))
+
+class PrefetchStats:
+    """Prefetch hit rate, wasted tokens and the hourly spend cap"""
+    WINDOW = 3600
+    
+    def __init__(self, max_tokens_per_hour=20000):
+        self.max_tokens_per_hour = max_tokens_per_hour
+        self.started = 0
+        self.hits = 0
+        self.discarded = 0
+        self.capped = 0
+        self.wasted_tokens = 0
+        self._spent = deque()  # (time, estimated tokens)
+    
+    def allow(self, tokens):
+        """Reserve tokens from the hourly cap - False if they don't fit"""
+        now = time.monotonic()
+        while self._spent and now - self._spent[0][0] >= self.WINDOW:
+            self._spent.popleft()
+        if self.max_tokens_per_hour and sum(t for _, t in self._spent) + tokens > self.max_tokens_per_hour:
+            self.capped += 1
+            return False
+        self._spent.append((now, tokens))
+        self.started += 1
+        return True
+    
+    def hit(self):
+        self.hits += 1
+    
+    def discard(self, prefetch):
+        self.discarded += 1
+        self.wasted_tokens += prefetch.spent_tokens()
+    
+    def stats_text(self):
+        rate = f"{self.hits * 100 // self.started}%" if self.started else "-"
+        return (f"Prefetch: {self.hits} of {self.started} used ({rate}), "
+                f"~{self.wasted_tokens} tokens wasted, {self.capped} over the cap")
+
+class PreviewLimiter:
+    """Per-minute cap on live previews, and how they went"""
+    WINDOW = 60
+    
+    def __init__(self, max_per_minute=6):
+        self.max_per_minute = max_per_minute
+        self.sent = 0
+        self.superseded = 0
+        self.held_back = 0
+        self._sent = deque()
+    
+    def wait_time(self):
+        """0 if a preview may start now, else seconds until a slot frees up"""
+        now = time.monotonic()
+        while self._sent and now - self._sent[0] >= self.WINDOW:
+            self._sent.popleft()
+        if self.max_per_minute and len(self._sent) >= self.max_per_minute:
+            return self.WINDOW - (now - self._sent[0])
+        return 0
+    
+    def record(self):
+        self._sent.append(time.monotonic())
+        self.sent += 1
+    
+    def stats_text(self):
+        return (f"Live preview: {self.sent} sent, {self.superseded} superseded while typing, "
+                f"{self.held_back} held back by the cap")
+
+class Alternatives:
+    """Spare versions of one text and style that "Again" shows without waiting"""
+    def __init__(self, text, style, shown):
+        self.text = text
+        self.style = style
+        self.shown = {shown}
+        self.candidates = []
+        self.generation = None  # set while a request for more is running
+    
+    def matches(self, text, style):
+        return (self.text, self.style) == (text, style)
+    
+    def add(self, candidates):
+        for candidate in candidates:
+            if candidate not in self.shown and candidate not in self.candidates:
+                self.candidates.append(candidate)
+    
+    def next(self):
+        """The next version nobody has seen yet, or None"""
+        if not self.candidates:
+            return None
+        candidate = self.candidates.pop(0)
+        self.shown.add(candidate)
+        return candidate
+
 class DobbyRephraser(QWidget):
-    result_ready = pyqtSignal(str)
-    error_occurred = pyqtSignal(str)
+    # Worker signals carry the generation id so stale results can be dropped
+    result_ready = pyqtSignal(int, str)
+    result_chunk = pyqtSignal(int, str)
+    compare_result = pyqtSignal(int, str, str, str)  # run id, style, text, error
+    progress_update = pyqtSignal(int, str)
+    error_occurred = pyqtSignal(int, str)
+    alternatives_ready = pyqtSignal(int, list)
     show_window_signal = pyqtSignal(str)
     
-    def __init__(self, app_instance=None):
+    def __init__(self, app_instance=None, engine=None, clipboard=None, injector=None):
         super().__init__()
         print("🔍 DobbyRephraser.__init__() started")
         
         self.app_instance = app_instance
+        self.engine = engine or RephraseEngine()
+        self.clipboard = clipboard or Clipboard(QApplication.clipboard())
+        self.injector = injector or KeyInjector.from_settings(INPUT_SETTINGS)
+        
+        # Paste goes back to the window the text was captured from
+        self.paste_target = None
+        self.deactivated = threading.Event()
+        self.paste_latency = LatencyStats("Paste")
+        
+        # Speculative generation of the last used style, started on capture
+        self.prefetch = None
+        self.prefetch_stats = PrefetchStats(PREFETCH_SETTINGS.get("max_tokens_per_hour", 20000))
+        
+        # Versions waiting for "Again", and how long Again took to show one
+        self.alternatives = None
+        self.again_started = None
+        self.again_latency = LatencyStats("Again")
+        
+        # Live preview - regenerate after a pause in typing
+        self.preview_generation = None
+        self.preview_limiter = PreviewLimiter(LIVE_PREVIEW_SETTINGS.get("max_per_minute", 6))
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.timeout.connect(self.live_preview)
+        
+        self.generation = None
+        self.generation_started = time.monotonic()
+        self.compare_generation = None
         self.original_text = ""
+        self.generation_style = None
+        self.last_rephrase = None  # (style, text, result) - edits reuse its unchanged paragraphs
         self.selected_style = "friendly"
         self.is_processing = False
         
+        # Compare mode state
+        self.compare_pending = 0
+        self.compare_cells = {}
+        
         print("🔍 Connecting signals...")
         self.result_ready.connect(self.show_result)
+        self.result_chunk.connect(self.append_result_chunk)
+        self.compare_result.connect(self.show_compare_result)
+        self.progress_update.connect(self.show_progress)
         self.error_occurred.connect(self.show_error)
+        self.alternatives_ready.connect(self.add_alternatives)
         self.show_window_signal.connect(self.show_with_text)
         print("🔍 Signals connected")
         
+        # ESC is a window shortcut, not a global hotkey - it only fires while Dobby has focus
+        self.close_shortcut = QShortcut(QKeySequence(HOTKEY_SETTINGS.get("close_window", "Esc")), self)
+        self.close_shortcut.activated.connect(self.hide)
+        
         print("🔍 Starting init_ui()...")
         self.init_ui()
         print("🔍 init_ui() completed")
+        self.text_edit.textChanged.connect(self.on_text_edited)
         
     def init_ui(self):
         self.setWindowFlags(Qt.WindowType.FramelessWindowHint | Qt.WindowType.WindowStaysOnTopHint)
@@ -572,8 +771,40 @@ class DobbyRephraser(QWidget):
                 opacity: 0.6;
             }
         """)
-        self.generate_btn.clicked.connect(self.start_generation)
-        content_layout.addWidget(self.generate_btn)
+        self.generate_btn.clicked.connect(lambda: self.start_generation())
+        
+        if COMPARE_SETTINGS.get("enabled", False):
+            # Compare button sits next to Generate, same row height
+            generate_row = QHBoxLayout()
+            generate_row.setSpacing(6)
+            generate_row.addWidget(self.generate_btn)
+            
+            self.compare_btn = QPushButton("⚡ Compare")
+            self.compare_btn.setFixedSize(130, 48)
+            self.compare_btn.setStyleSheet("""
+                QPushButton {
+                    background: #f8fafc;
+                    color: #6366f1;
+                    border: 1px solid rgba(99, 102, 241, 0.4);
+                    border-radius: 8px;
+                    font-weight: 600;
+                    font-size: 15px;
+                    font-family: 'Inter', 'Poppins', 'DM Sans', 'Segoe UI', sans-serif;
+                }
+                QPushButton:hover {
+                    background: #eef2ff;
+                }
+                QPushButton:disabled {
+                    color: #9ca3af;
+                    border-color: #e5e7eb;
+                }
+            """)
+            self.compare_btn.clicked.connect(self.start_comparison)
+            generate_row.addWidget(self.compare_btn)
+            content_layout.addLayout(generate_row)
+        else:
+            self.compare_btn = None
+            content_layout.addWidget(self.generate_btn)
         
         # Убираем spacing после кнопки Generate Text чтобы не было пустого места
         # content_layout.addSpacing(4)  # Убрали чтобы не было лишнего места
@@ -636,7 +867,7 @@ class DobbyRephraser(QWidget):
         # Result header
         result_header_layout = QHBoxLayout()
         result_icon = QLabel("✨")
-        result_title = QLabel("Generated Result")
+        self.result_title = result_title = QLabel("Generated Result")
         result_title.setStyleSheet("""
             font-weight: 600; 
             color: #6366f1;
@@ -685,7 +916,8 @@ class DobbyRephraser(QWidget):
                 background: #d1fae5;
             }
         """)
-        self.again_btn.clicked.connect(self.start_generation)
+        # Again shows a version fetched in the background, or asks the model for a fresh one
+        self.again_btn.clicked.connect(self.again)
         
         self.paste_btn = QPushButton("📝 Paste")
         self.paste_btn.setStyleSheet("""
@@ -716,6 +948,38 @@ class DobbyRephraser(QWidget):
         card_layout.addWidget(self.result_card)
         self.result_card.hide()  # Hide initially
         
+        # Compare card takes the result card's place - same fixed height
+        self.compare_card = QFrame()
+        self.compare_card.setFixedHeight(180)
+        self.compare_card.setStyleSheet(self.result_card.styleSheet())
+        compare_layout = QVBoxLayout(self.compare_card)
+        compare_layout.setContentsMargins(12, 6, 12, 6)
+        compare_layout.setSpacing(4)
+        
+        compare_title = QLabel("⚡ Style Comparison")
+        compare_title.setStyleSheet("""
+            font-weight: 600; 
+            color: #6366f1;
+            border: none;
+            background: transparent;
+            font-family: 'Inter', 'Poppins', 'DM Sans', 'Segoe UI', sans-serif;
+        """)
+        compare_layout.addWidget(compare_title)
+        
+        compare_scroll = QScrollArea()
+        compare_scroll.setWidgetResizable(True)
+        compare_scroll.setStyleSheet("QScrollArea { border: none; background: transparent; }")
+        compare_grid_widget = QWidget()
+        compare_grid_widget.setStyleSheet("background: transparent;")
+        self.compare_grid = QGridLayout(compare_grid_widget)
+        self.compare_grid.setContentsMargins(0, 0, 0, 0)
+        self.compare_grid.setSpacing(6)
+        compare_scroll.setWidget(compare_grid_widget)
+        compare_layout.addWidget(compare_scroll)
+        
+        card_layout.addWidget(self.compare_card)
+        self.compare_card.hide()
+        
         # Removed spacer to eliminate excess white space
         
         # DON'T add stretch - it interferes with result card display
@@ -865,115 +1129,510 @@ class DobbyRephraser(QWidget):
         self.selected_style = style
         for key, btn in self.style_buttons.items():
             btn.setChecked(key == style)
+        if self.prefetch and self.prefetch.style != style:
+            self.discard_prefetch("style changed")
+    
+    def on_text_edited(self):
+        if self.prefetch and self.text_edit.toPlainText().strip() != self.prefetch.text:
+            self.discard_prefetch("text changed")
+        if LIVE_PREVIEW_SETTINGS.get("enabled", False) and self.isVisible():
+            self.preview_timer.start(LIVE_PREVIEW_SETTINGS.get("delay_ms", 800))
+    
+    def live_preview(self):
+        """Regenerate the current style after a typing pause (LIVE_PREVIEW_SETTINGS).
+        
+        Goes through start_generation(), so a newer preview cancels the older
+        one and text that is back to something already rephrased comes from
+        the cache.
+        """
+        text = self.text_edit.toPlainText().strip()
+        if len(text) < LIVE_PREVIEW_SETTINGS.get("min_chars", 3) or not self.selected_style or not self.isVisible():
+            return
+        if text == self.original_text and (self.generation or self.result_card.isVisible()):
+            return  # This text is already shown or on its way
+        
+        wait = self.preview_limiter.wait_time()
+        if wait:
+            self.preview_limiter.held_back += 1
+            print(f"⏳ Live preview held back {wait:.0f}s by max_per_minute")
+            self.preview_timer.start(int(wait * 1000) + 1)
+            return
+        
+        if self.generation:
+            self.preview_limiter.superseded += 1
+        self.preview_limiter.record()
+        self.start_generation()
+        self.preview_generation = self.generation
+    
+    def start_prefetch(self, text):
+        """Start generating the last used style right after capture (PREFETCH_SETTINGS)"""
+        style = self.selected_style
+        if (not PREFETCH_SETTINGS.get("enabled", False) or not self.engine.has_api_key
+                or style not in self.engine.styles or len(text) > PREFETCH_SETTINGS.get("max_chars", 2000)):
+            return
+        payload = self.engine.build_payload(text, style)
+        if not self.prefetch_stats.allow(estimate_tokens(payload)):
+            print("⏳ Prefetch skipped - hourly prefetch budget used up")
+            return
+        
+        generation = Generation()
+        self.prefetch = Prefetch(text, style, generation, estimate_tokens({"messages": payload["messages"]}))
+        print(f"🔮 Prefetching {style} (generation {generation.id})")
+        future = self.engine.submit(
+            text, style,
+            generation=generation,
+            priority=PRIORITY_BACKGROUND,
+            on_delta=lambda delta: self.result_chunk.emit(generation.id, delta),
+            on_progress=lambda message: self.progress_update.emit(generation.id, message))
+        future.add_done_callback(partial(self.generation_done, generation, self.prefetch.started))
     
-    def start_generation(self):
+    def discard_prefetch(self, reason):
+        prefetch, self.prefetch = self.prefetch, None
+        prefetch.generation.cancel()
+        self.prefetch_stats.discard(prefetch)
+        print(f"🗑️ Prefetch discarded ({reason}), ~{prefetch.spent_tokens()} tokens wasted")
+    
+    def is_prefetching(self, generation_id):
+        """True while generation_id is a prefetch nobody has asked for yet"""
+        return self.prefetch is not None and generation_id == self.prefetch.generation.id
+    
+    def start_generation(self, bypass_cache=False):
         text = self.text_edit.toPlainText().strip()
         if not text or not self.selected_style:
             QMessageBox.warning(self, "Missing Information", "Please enter text and select a writing style.")
             return
         
         self.original_text = text
+        self.generation_style = self.selected_style
+        self.again_started = None
+        
+        # Take over the prefetch when it is for exactly this request
+        prefetch = None
+        if self.prefetch and not bypass_cache and (self.prefetch.text, self.prefetch.style) == (text, self.selected_style):
+            prefetch, self.prefetch = self.prefetch, None
+        
+        # A new generation supersedes whatever is still running
+        self.cancel_generation()
+        self.generation = prefetch.generation if prefetch else Generation()
+        self.generation_started = prefetch.started if prefetch else time.monotonic()
+        self.stream_started = False
         self.generate_btn.setEnabled(False)
         self.generate_btn.setText("Generating...")
         self.result_card.hide()
+        self.compare_card.hide()
+        self.progress_label.setText("Creating your text...")
         self.progress_section.show()  # Show progress section instead of individual elements
         
-        # Start API call in thread
-        threading.Thread(target=self.call_api, daemon=True).start()
+        if prefetch:
+            self.prefetch_stats.hit()
+            print(f"🔮 Using prefetched generation {prefetch.generation.id}")
+            if prefetch.error is not None:
+                self.show_error(prefetch.generation.id, prefetch.error)
+            elif prefetch.result is not None:
+                self.show_result(prefetch.generation.id, prefetch.result)
+            elif prefetch.parts:
+                self.append_result_chunk(prefetch.generation.id, "".join(prefetch.parts))
+            return
+        
+        # After an edit only the changed paragraphs are sent again
+        previous = None
+        if not bypass_cache and self.last_rephrase and self.last_rephrase[0] == self.selected_style:
+            previous = self.last_rephrase[1:]
+        
+        # Runs on the engine loop - it only gets copies, never reads the widgets
+        generation = self.generation
+        future = self.engine.submit(
+            text, self.selected_style,
+            generation=generation,
+            bypass_cache=bypass_cache,
+            previous=previous,
+            on_delta=lambda delta: self.result_chunk.emit(generation.id, delta),
+            on_progress=lambda message: self.progress_update.emit(generation.id, message))
+        future.add_done_callback(partial(self.generation_done, generation, self.generation_started))
+    
+    def cancel_generation(self):
+        """Abort in-flight requests; their results will be ignored"""
+        if self.prefetch:
+            self.discard_prefetch("window closed or new capture")
+        
+        if self.generation:
+            print(f"🛑 Cancelling generation {self.generation.id}")
+            self.generation.cancel()
+            self.generation = None
+            self.progress_section.hide()
+            self.generate_btn.setEnabled(True)
+            self.generate_btn.setText("Generate Text")
+        
+        if self.compare_generation:
+            print(f"🛑 Cancelling comparison {self.compare_generation.id}")
+            self.compare_generation.cancel()
+            self.compare_generation = None
+            self.compare_btn.setEnabled(True)
+            self.compare_btn.setText("⚡ Compare")
     
-    def call_api(self):
+    def is_current(self, generation_id):
+        if self.generation and generation_id == self.generation.id:
+            return True
+        print(f"🗑️ Dropping result of superseded generation {generation_id}")
+        return False
+    
+    def generation_done(self, generation, started, future):
+        """Called on the engine loop when a request ends - only emits signals"""
+        if future.cancelled():
+            print(f"🛑 Generation {generation.id} stopped")
+            return
         try:
-            if not FIREWORKS_API_KEY or len(FIREWORKS_API_KEY) < 10:
-                self.error_occurred.emit("Please configure API key in config.py")
-                return
-            
-            style_data = WRITING_STYLES[self.selected_style]
-            prompt = style_data['prompt'].format(input_text=self.original_text)
-            
-            payload = {
-                "model": MODEL_NAME,
-                "messages": [{"role": "user", "content": prompt}],
-                **API_SETTINGS
-            }
+            generated_text = future.result()
+            if generation.from_cache:
+                print(f"⚡ Cache hit after {(time.monotonic() - started) * 1000:.0f} ms")
+            self.result_ready.emit(generation.id, generated_text)
+        
+        except GenerationCancelled:
+            print(f"🛑 Generation {generation.id} stopped")
+        except ApiError as e:
+            self.error_occurred.emit(generation.id, str(e))
+        except Exception as e:
+            if generation.cancelled:
+                print(f"🛑 Generation {generation.id} stopped")
+            else:
+                self.error_occurred.emit(generation.id, f"Error: {str(e)}")
+    
+    def show_progress(self, generation_id, text):
+        if self.generation and generation_id == self.generation.id:
+            self.progress_label.setText(text)
+    
+    def start_comparison(self):
+        text = self.text_edit.toPlainText().strip()
+        if not text:
+            QMessageBox.warning(self, "Missing Information", "Please enter text to compare.")
+            return
+        if not self.engine.has_api_key:
+            QMessageBox.critical(self, "Error", "Please configure API key in config.py")
+            return
+        
+        styles = [s for s in (COMPARE_SETTINGS.get("styles") or WRITING_STYLES) if s in WRITING_STYLES]
+        self.original_text = text
+        self.cancel_generation()
+        self.compare_generation = Generation()
+        self.compare_pending = len(styles)
+        self.compare_started = time.monotonic()
+        
+        self.result_card.hide()
+        self.fill_compare_grid(styles)
+        self.compare_card.show()
+        self.compare_btn.setEnabled(False)
+        self.compare_btn.setText("Comparing...")
+        
+        for style in styles:
+            future = self.engine.submit(text, style, generation=self.compare_generation,
+                                        priority=PRIORITY_BACKGROUND, stream=False)
+            future.add_done_callback(partial(self.compare_done, self.compare_generation, style))
+    
+    def compare_done(self, generation, style, future):
+        """Called on the engine loop for each compared style - only emits signals"""
+        if future.cancelled() or generation.cancelled:
+            return
+        try:
+            self.compare_result.emit(generation.id, style, future.result(), "")
+        except Exception as e:
+            self.compare_result.emit(generation.id, style, "", str(e))
+    
+    def fill_compare_grid(self, styles):
+        """Rebuild the comparison grid with one empty cell per style"""
+        while self.compare_grid.count():
+            item = self.compare_grid.takeAt(0)
+            if item.widget():
+                item.widget().deleteLater()
+        self.compare_cells = {}
+        
+        for index, style in enumerate(styles):
+            cell = QFrame()
+            cell.setStyleSheet("QFrame { background: white; border: 1px solid #e5e7eb; border-radius: 6px; }")
+            cell_layout = QVBoxLayout(cell)
+            cell_layout.setContentsMargins(6, 4, 6, 4)
+            cell_layout.setSpacing(2)
             
-            headers = {
-                "Accept": "application/json",
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {FIREWORKS_API_KEY}"
-            }
+            header = QHBoxLayout()
+            name = QLabel(WRITING_STYLES[style]['name'])
+            name.setStyleSheet("border: none; font-size: 12px; font-weight: 600; color: #6b7280;")
+            use_btn = QPushButton("📝 Paste")
+            use_btn.setEnabled(False)
+            use_btn.setStyleSheet("""
+                QPushButton {
+                    background: #f0fdfa;
+                    color: #0891b2;
+                    border: 1px solid #e0f2fe;
+                    border-radius: 4px;
+                    padding: 2px 8px;
+                    font-size: 12px;
+                }
+                QPushButton:disabled {
+                    color: #9ca3af;
+                }
+            """)
+            use_btn.clicked.connect(lambda checked, style=style: self.use_compare_result(style))
+            header.addWidget(name)
+            header.addStretch()
+            header.addWidget(use_btn)
+            cell_layout.addLayout(header)
             
-            response = requests.post(FIREWORKS_URL, 
-                                   headers=headers, 
-                                   data=json.dumps(payload),
-                                   timeout=30)
+            text = QTextEdit()
+            text.setFixedHeight(60)
+            text.setPlaceholderText("Creating your text...")
+            text.setStyleSheet("QTextEdit { border: none; font-size: 13px; color: #374151; }")
+            cell_layout.addWidget(text)
             
-            if response.status_code == 200:
-                result = response.json()
-                if 'choices' in result and len(result['choices']) > 0:
-                    generated_text = result['choices'][0]['message']['content'].strip()
-                    self.result_ready.emit(generated_text)
-                else:
-                    self.error_occurred.emit("Invalid API response format")
-            else:
-                self.error_occurred.emit(f"API Error {response.status_code}: {response.text}")
-                
-        except Exception as e:
-            self.error_occurred.emit(f"Error: {str(e)}")
+            self.compare_grid.addWidget(cell, index // 2, index % 2)
+            self.compare_cells[style] = (text, use_btn)
+    
+    def show_compare_result(self, generation_id, style, text, error):
+        generation = self.compare_generation
+        if not generation or generation.id != generation_id or generation.cancelled:
+            return  # Result from an older or cancelled comparison
+        
+        text_edit, use_btn = self.compare_cells[style]
+        if error:
+            text_edit.setPlainText(f"⚠️ {error}")
+        else:
+            text_edit.setPlainText(text)
+            use_btn.setEnabled(True)
+        
+        self.compare_pending -= 1
+        if self.compare_pending == 0:
+            print(f"⏱️ Compared {len(self.compare_cells)} styles in {(time.monotonic() - self.compare_started) * 1000:.0f} ms")
+            self.compare_btn.setEnabled(True)
+            self.compare_btn.setText("⚡ Compare")
+            self.compare_generation = None
+    
+    def use_compare_result(self, style):
+        text_edit, _ = self.compare_cells[style]
+        self.select_style(style)
+        self.result_text.setPlainText(text_edit.toPlainText())
+        self.paste_result()
+    
+    def append_result_chunk(self, generation_id, text):
+        if self.is_prefetching(generation_id):
+            self.prefetch.parts.append(text)
+            return
+        if not self.is_current(generation_id):
+            return
+        if not self.stream_started:
+            self.stream_started = True
+            print(f"⏱️ First words after {(time.monotonic() - self.generation_started) * 1000:.0f} ms")
+            self.progress_section.hide()
+            self.result_text.clear()
+            self.result_card.show()
+        
+        cursor = self.result_text.textCursor()
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.insertText(text)
     
-    def show_result(self, text):
+    def show_result(self, generation_id, text):
+        if self.is_prefetching(generation_id):
+            self.prefetch.result = text
+            return
+        if not self.is_current(generation_id):
+            return
         self.progress_section.hide()  # Hide entire progress section
         self.generate_btn.setEnabled(True)
         self.generate_btn.setText("Generate Text")  # Icon is preserved automatically
         
         self.result_text.setPlainText(text)
+        if self.generation.truncated:
+            self.result_title.setText("Generated Result  ✂️ cut off - check before pasting")
+        else:
+            self.result_title.setText("Generated Result  ⚡ cached" if self.generation.from_cache else "Generated Result")
+        preview = self.preview_generation is self.generation
+        self.generation = None
+        self.last_rephrase = (self.generation_style, self.original_text, text)
+        if self.again_started is not None:
+            self.again_latency.record("fresh", time.monotonic() - self.again_started)
+            self.again_started = None
         
         # NO height adjustment - fixed height prevents layout jumping!
         # QTimer.singleShot(100, self.adjust_result_text_height)
         
         self.result_card.show()
+        if not preview:
+            # Previews come on every pause in typing - spare versions would get round PreviewLimiter
+            self.fetch_alternatives(text)
+    
+    def again(self):
+        """Show the next prepared version at once, or generate a fresh one"""
+        started = time.monotonic()
+        text = self.text_edit.toPlainText().strip()
+        alternatives = self.alternatives
+        if not alternatives or not alternatives.matches(text, self.selected_style):
+            alternatives = None
+        
+        candidate = alternatives.next() if alternatives else None
+        if candidate is not None:
+            self.cancel_generation()
+            self.show_alternative(candidate, "instant", started)
+        elif alternatives and alternatives.generation:
+            # More versions are on their way - wait for them instead of asking twice
+            self.cancel_generation()
+            self.again_started = started
+            self.progress_label.setText("Creating your text...")
+            self.progress_section.show()
+        else:
+            self.start_generation(bypass_cache=True)
+            self.again_started = started
+    
+    def show_alternative(self, candidate, name, started):
+        self.progress_section.hide()
+        self.result_text.setPlainText(candidate)
+        self.last_rephrase = (self.selected_style, self.original_text, candidate)
+        self.result_title.setText("Generated Result")
+        self.result_card.show()
+        self.again_latency.record(name, time.monotonic() - started)
+        print(f"🔁 Again: showing a prepared version ({len(self.alternatives.candidates)} left)")
+        self.fetch_alternatives(candidate)
+    
+    def fetch_alternatives(self, shown):
+        """Ask for spare versions of the current text in the background (ALTERNATIVES_SETTINGS).
+        
+        The first set may come from the cache; once every version has been
+        shown the next set is always fresh.
+        """
+        if not ALTERNATIVES_SETTINGS.get("enabled", False) or not self.engine.has_api_key:
+            return
+        text, style = self.original_text, self.selected_style
+        alternatives = self.alternatives
+        if alternatives and alternatives.matches(text, style):
+            alternatives.shown.add(shown)
+            if alternatives.candidates or alternatives.generation:
+                return
+            bypass_cache = True
+        else:
+            self.drop_alternatives()
+            alternatives = self.alternatives = Alternatives(text, style, shown)
+            bypass_cache = False
+        
+        generation = alternatives.generation = Generation()
+        future = self.engine.submit_alternatives(
+            text, style,
+            count=ALTERNATIVES_SETTINGS.get("count", 2),
+            temperature=ALTERNATIVES_SETTINGS.get("temperature"),
+            generation=generation,
+            priority=PRIORITY_BACKGROUND,
+            bypass_cache=bypass_cache)
+        future.add_done_callback(partial(self.alternatives_done, generation))
+    
+    def alternatives_done(self, generation, future):
+        """Runs on an engine thread - hand the versions to the GUI thread"""
+        if future.cancelled():
+            return
+        try:
+            candidates = future.result()
+        except GenerationCancelled:
+            return
+        except Exception as e:
+            print(f"⚠️ Could not prepare alternatives: {e}")
+            candidates = []
+        self.alternatives_ready.emit(generation.id, candidates)
+    
+    def add_alternatives(self, generation_id, candidates):
+        alternatives = self.alternatives
+        if not alternatives or not alternatives.generation or alternatives.generation.id != generation_id:
+            return
+        alternatives.generation = None
+        alternatives.add(candidates)
+        print(f"🔁 {len(alternatives.candidates)} alternative version(s) ready for Again")
+        
+        # Again was pressed while these were coming
+        if self.again_started is not None and self.generation is None:
+            started, self.again_started = self.again_started, None
+            candidate = alternatives.next()
+            if candidate is not None:
+                self.show_alternative(candidate, "waited", started)
+            else:
+                self.start_generation(bypass_cache=True)
+                self.again_started = started
+    
+    def drop_alternatives(self):
+        self.again_started = None
+        alternatives, self.alternatives = self.alternatives, None
+        if alternatives and alternatives.generation:
+            alternatives.generation.cancel()
     
-    def show_error(self, error):
+    def show_error(self, generation_id, error):
+        if self.is_prefetching(generation_id):
+            self.prefetch.error = error
+            return
+        if not self.is_current(generation_id):
+            return
         self.progress_section.hide()  # Hide entire progress section
         self.generate_btn.setEnabled(True)
         self.generate_btn.setText("Generate Text")  # Icon is preserved automatically
+        preview = self.preview_generation is self.generation
+        self.generation = None
+        self.again_started = None
         
+        if preview:
+            print(f"⚠️ Live preview failed: {error}")  # No dialog in the middle of typing
+            return
         QMessageBox.critical(self, "Error", error)
     
     def paste_result(self):
         text = self.result_text.toPlainText()
         if text:
-            # Copy to clipboard
-            pyperclip.copy(text)
+            started = time.monotonic()
+            
+            # Copy to clipboard, remembering what the user had there
+            previous = self.clipboard.snapshot() if CLIPBOARD_SETTINGS.get("restore", True) else None
+            self.clipboard.set_text(text)
             self.paste_btn.setText("✅ Pasted!")
             
-            # Hide window and auto-paste
+            # Hide window and auto-paste as soon as the original app has focus again
+            self.deactivated.clear()
             self.hide()
             
-            # Auto-paste after small delay
             def do_paste():
-                time.sleep(0.3)
-                pyautogui.hotkey('ctrl', 'a')  # Select all
-                time.sleep(0.1)
-                pyautogui.hotkey('ctrl', 'v')  # Paste
+                timeout = INPUT_SETTINGS.get("focus_timeout_ms", 500) / 1000
+                if not wait_for_focus(self.paste_target, self.deactivated, timeout):
+                    print(f"⏱️ Focus didn't come back within {timeout * 1000:.0f} ms - pasting anyway")
+                focus_time = time.monotonic() - started
+                self.injector.hotkey('ctrl', 'a')  # Select all
+                self.injector.hotkey('ctrl', 'v')  # Paste
+                paste_time = time.monotonic() - started
+                self.paste_latency.record("focus", focus_time)
+                self.paste_latency.record("paste", paste_time)
+                print(f"⏱️ Pasted after {paste_time * 1000:.0f} ms (focus back after {focus_time * 1000:.0f} ms)")
+                if previous is not None:
+                    time.sleep(CLIPBOARD_SETTINGS.get("restore_delay_ms", 500) / 1000)
+                    self.clipboard.restore(previous)
             
-            import threading
             threading.Thread(target=do_paste, daemon=True).start()
             
             # Reset button text after 2 seconds
             QTimer.singleShot(2000, lambda: self.paste_btn.setText("📝 Paste"))
     
     
+    def changeEvent(self, event):
+        """Tell a waiting paste when the window has let go of the focus"""
+        if event.type() == QEvent.Type.ActivationChange and not self.isActiveWindow():
+            self.deactivated.set()
+        super().changeEvent(event)
+    
     def show_with_text(self, text):
         print(f"🔍 show_with_text called with: '{text[:50]}...'")
         
+        # New capture - anything still generating for the old text is stale
+        self.cancel_generation()
+        self.drop_alternatives()
+        
         # Hide result card and progress section first
         self.result_card.hide()
+        self.compare_card.hide()
         self.progress_section.hide()
         print("🔍 Result card and progress hidden")
         
         # Set text without any layout changes
         self.text_edit.setPlainText(text)
+        self.preview_timer.stop()  # Captured, not typed
         print(f"🔍 Text set: {len(text)} characters")
+        self.start_prefetch(text.strip())
         
         # *** FORCE FULL LAYOUT CYCLE (ChatGPT совет) ***
         print("🔍 Forcing full layout cycle to fix 'кривость'...")
@@ -1046,6 +1705,13 @@ class DobbyRephraser(QWidget):
         self.setWindowState(Qt.WindowState.WindowActive)
         print("Window should be visible now!")
     
+    def hideEvent(self, event):
+        """ESC, the close button and closing to tray all stop running requests"""
+        self.cancel_generation()
+        self.drop_alternatives()
+        self.preview_timer.stop()
+        super().hideEvent(event)
+    
     def closeEvent(self, event):
         """Handle window close event - minimize to tray instead of exit"""
         if QSystemTrayIcon.isSystemTrayAvailable():
@@ -1113,12 +1779,306 @@ class DobbyRephraser(QWidget):
         
         print("🔍 === END DEBUG ===\n")
 
+class Clipboard(QObject):
+    """Clipboard for every thread, backed by QClipboard.
+    
+    QClipboard only works on the GUI thread, so calls from workers are
+    queued there and waited for. pyperclip is only used when that doesn't
+    answer within bridge_timeout. Workers can also wait for the next
+    clipboard change, and snapshot() / restore() keep every format the
+    user had copied, not just text.
+    """
+    _invoke = pyqtSignal(object)
+    
+    def __init__(self, clipboard, bridge_timeout=0.5):
+        super().__init__()
+        self.clipboard = clipboard
+        self.bridge_timeout = bridge_timeout
+        self.sequence = 0
+        self.bridged = 0
+        self.fallbacks = 0
+        self._gui_thread = threading.get_ident()
+        self._changed = threading.Condition()
+        self._invoke.connect(self._run_call)
+        clipboard.dataChanged.connect(self.on_changed)
+    
+    def on_changed(self):
+        with self._changed:
+            self.sequence += 1
+            self._changed.notify_all()
+    
+    def wait_for_change(self, since, timeout):
+        """True once the clipboard changed after `since`, False at the deadline"""
+        with self._changed:
+            return self._changed.wait_for(lambda: self.sequence != since, timeout)
+    
+    def _run_call(self, call):
+        call()
+    
+    def on_gui(self, function, fallback):
+        """function() on the GUI thread - fallback() here if it doesn't get there in time"""
+        if threading.get_ident() == self._gui_thread:
+            return function()
+        done = threading.Event()
+        result = {}
+        
+        def call():
+            try:
+                result["value"] = function()
+            except Exception as e:
+                result["error"] = e
+            done.set()
+        
+        self.bridged += 1
+        self._invoke.emit(call)
+        if not done.wait(self.bridge_timeout):
+            self.fallbacks += 1
+            print("⚠️ GUI thread busy - using pyperclip")
+            return fallback()
+        if "error" in result:
+            raise result["error"]
+        return result.get("value")
+    
+    def text(self):
+        return self.on_gui(self.clipboard.text, pyperclip.paste)
+    
+    def set_text(self, text):
+        self.on_gui(lambda: self.clipboard.setText(text), lambda: pyperclip.copy(text))
+    
+    def snapshot(self):
+        """Copy of everything on the clipboard, for restore()"""
+        def copy_mime_data():
+            source = self.clipboard.mimeData()
+            copy = QMimeData()
+            for mime_format in source.formats() if source else []:
+                copy.setData(mime_format, source.data(mime_format))
+            return copy
+        return self.on_gui(copy_mime_data, pyperclip.paste)
+    
+    def restore(self, snapshot):
+        if isinstance(snapshot, str):
+            self.set_text(snapshot)  # taken by the pyperclip fallback
+        else:
+            self.on_gui(lambda: self.clipboard.setMimeData(snapshot), lambda: None)
+    
+    def stats_text(self):
+        return f"Clipboard: Qt, {self.bridged} calls from other threads, {self.fallbacks} pyperclip fallbacks"
+
+def foreground_window():
+    """Handle of the window in front - Windows only, None elsewhere"""
+    if sys.platform != "win32":
+        return None
+    import ctypes
+    return ctypes.windll.user32.GetForegroundWindow()
+
+def wait_for_focus(target, deactivated, timeout):
+    """Wait until Dobby has let go of the focus and, where the platform
+    tells us, the target window is in front again. False at the deadline."""
+    deadline = time.monotonic() + timeout
+    if not deactivated.wait(timeout):
+        return False
+    while target and foreground_window() != target:
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+class KeyInjector:
+    """Sends key combinations to whichever window has the focus.
+    
+    "pynput" drives pynput's keyboard Controller. "pyautogui" is the old
+    backend, kept as a fallback and called without its default PAUSE.
+    """
+    def __init__(self, backend="pynput"):
+        self.backend = backend
+        self._controller = keyboard.Controller() if backend == "pynput" else None
+    
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(settings.get("backend", "pynput"))
+    
+    def hotkey(self, *keys):
+        """Press keys like pyautogui.hotkey: hotkey("ctrl", "v")"""
+        if self.backend != "pynput":
+            pyautogui.hotkey(*keys, _pause=False)
+            return
+        modifiers = [getattr(keyboard.Key, key) for key in keys[:-1]]
+        for modifier in modifiers:
+            self._controller.press(modifier)
+        try:
+            self._controller.tap(keys[-1])
+        finally:
+            for modifier in reversed(modifiers):
+                self._controller.release(modifier)
+
+class HotkeyWorker(threading.Thread):
+    """Runs hotkey actions off the hotkey listener thread.
+    
+    The listener only calls trigger(), which queues the action and
+    returns at once. A press of an action that is already queued or running,
+    or that comes within `debounce` seconds of its last start, collapses
+    into that run instead of starting another one.
+    """
+    def __init__(self, actions, debounce=0.3):
+        super().__init__(name="dobby-hotkeys", daemon=True)
+        self.actions = actions  # name -> callable(pressed_at)
+        self.debounce = debounce
+        self.collapsed = 0
+        self._pending = []  # (name, pressed_at), oldest first
+        self._running = None
+        self._last_started = {}
+        self._cond = threading.Condition()
+    
+    def trigger(self, name):
+        """Called on the listener thread - never blocks on the action"""
+        pressed_at = time.monotonic()
+        with self._cond:
+            if (name == self._running or any(name == queued for queued, _ in self._pending)
+                    or pressed_at - self._last_started.get(name, float("-inf")) < self.debounce):
+                self.collapsed += 1
+                return
+            self._pending.append((name, pressed_at))
+            self._cond.notify()
+    
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                name, pressed_at = self._pending.pop(0)
+                self._running = name
+                self._last_started[name] = time.monotonic()
+            try:
+                self.actions[name](pressed_at)
+            except Exception as e:
+                print(f"Hotkey error: {e}")
+            finally:
+                with self._cond:
+                    self._running = None
+    
+    def stats_text(self):
+        return f"Hotkeys: {self.collapsed} repeated presses collapsed"
+
+class GlobalHotkeys:
+    """System-wide hotkeys that register only the configured combinations.
+    
+    On Windows they go to RegisterHotKey, so no other keystroke ever reaches
+    Python; elsewhere pynput's GlobalHotKeys does the matching. Bindings use
+    pynput syntax ("<f2>", "<ctrl>+<alt>+r") and call on_hotkey(action).
+    """
+    MODIFIERS = {"<alt>": 0x0001, "<ctrl>": 0x0002, "<shift>": 0x0004, "<cmd>": 0x0008}
+    KEYS = {"<esc>": 0x1B, "<space>": 0x20, "<tab>": 0x09, "<enter>": 0x0D, "<insert>": 0x2D,
+            "<delete>": 0x2E, "<home>": 0x24, "<end>": 0x23, "<pause>": 0x13}
+    MOD_NOREPEAT = 0x4000
+    WM_HOTKEY = 0x0312
+    WM_QUIT = 0x0012
+    
+    def __init__(self, bindings, on_hotkey):
+        self.bindings = {action: combo for action, combo in bindings.items() if combo}
+        self.on_hotkey = on_hotkey
+        self.presses = 0
+        self.backend = "RegisterHotKey" if sys.platform == "win32" else "pynput"
+        self._thread = None
+        self._thread_id = None
+        self._listener = None
+    
+    def fire(self, action):
+        self.presses += 1
+        self.on_hotkey(action)
+    
+    def start(self):
+        if self.backend == "RegisterHotKey":
+            self._thread = threading.Thread(target=self._run_windows, name="dobby-hotkeys-win", daemon=True)
+            self._thread.start()
+        else:
+            self._listener = keyboard.GlobalHotKeys({combo: partial(self.fire, action)
+                                                     for action, combo in self.bindings.items()})
+            self._listener.daemon = True
+            self._listener.start()
+        print(f"⌨️ Hotkeys via {self.backend}: " + ", ".join(f"{a} = {c}" for a, c in self.bindings.items()))
+    
+    def parse(self, combo):
+        """(modifier flags, virtual key) for a pynput-style combination"""
+        modifiers, key = 0, None
+        for part in combo.lower().split("+"):
+            if part in self.MODIFIERS:
+                modifiers |= self.MODIFIERS[part]
+            elif part in self.KEYS:
+                key = self.KEYS[part]
+            elif part.startswith("<f") and part[2:-1].isdigit():
+                key = 0x6F + int(part[2:-1])  # VK_F1 is 0x70
+            elif len(part) == 1 and part.isalnum():
+                key = ord(part.upper())
+            else:
+                raise ValueError(f"Unsupported key '{part}' in hotkey '{combo}'")
+        if key is None:
+            raise ValueError(f"Hotkey '{combo}' has no key besides modifiers")
+        return modifiers, key
+    
+    def _run_windows(self):
+        import ctypes
+        from ctypes import wintypes
+        user32 = ctypes.windll.user32
+        self._thread_id = ctypes.windll.kernel32.GetCurrentThreadId()
+        
+        # Hotkeys belong to the thread that registers them, so register and listen here
+        actions = {}
+        for hotkey_id, (action, combo) in enumerate(self.bindings.items(), 1):
+            try:
+                modifiers, key = self.parse(combo)
+            except ValueError as e:
+                print(f"⚠️ {e}")
+                continue
+            if user32.RegisterHotKey(None, hotkey_id, modifiers | self.MOD_NOREPEAT, key):
+                actions[hotkey_id] = action
+            else:
+                print(f"⚠️ Hotkey {combo} is already used by another app")
+        
+        msg = wintypes.MSG()
+        while user32.GetMessageW(ctypes.byref(msg), None, 0, 0) > 0:
+            if msg.message == self.WM_HOTKEY and msg.wParam in actions:
+                self.fire(actions[msg.wParam])
+        for hotkey_id in actions:
+            user32.UnregisterHotKey(None, hotkey_id)
+    
+    def stop(self):
+        if self._listener:
+            self._listener.stop()
+        elif self._thread_id:
+            import ctypes
+            ctypes.windll.user32.PostThreadMessageW(self._thread_id, self.WM_QUIT, 0, 0)
+    
+    def label(self, action):
+        """Binding as people write it: "<ctrl>+<alt>+r" -> "Ctrl+Alt+R" """
+        return "+".join(part.strip("<>").capitalize() for part in self.bindings.get(action, "").split("+"))
+    
+    def stats_text(self):
+        return f"Hotkeys ({self.backend}): {self.presses} presses"
+
 class DobbyApp:
     def __init__(self):
         self.app = QApplication(sys.argv)
         self.app.setQuitOnLastWindowClosed(False)
         
-        self.window = DobbyRephraser(app_instance=self)
+        # One engine (pooled HTTP client, cache, scheduler) for every request path.
+        # Values are passed in because the setup dialog may have just written config.py
+        self.engine = RephraseEngine(api_key=FIREWORKS_API_KEY, url=FIREWORKS_URL, model=MODEL_NAME,
+                                     styles=WRITING_STYLES, api_settings=API_SETTINGS)
+        print(f"🔌 HTTP client: {'httpx (HTTP/2)' if self.engine.client.http2 else 'requests (keep-alive)'}")
+        
+        self.clipboard = Clipboard(self.app.clipboard())
+        self.injector = KeyInjector.from_settings(INPUT_SETTINGS)
+        self.window = DobbyRephraser(app_instance=self, engine=self.engine,
+                                     clipboard=self.clipboard, injector=self.injector)
+        
+        # F2 capture: time every step up to the window
+        self.hotkey_latency = LatencyStats("F2")
+        self.hotkey_pressed_at = None
+        self.window.show_window_signal.connect(self.record_hotkey_latency)
+        self.hotkey_worker = HotkeyWorker({"capture": self.show_menu_hotkey},
+                                          HOTKEY_SETTINGS.get("debounce_ms", 300) / 1000)
+        self.hotkeys = GlobalHotkeys({"capture": HOTKEY_SETTINGS.get("capture", "<f2>")},
+                                     self.hotkey_worker.trigger)
         
         # Set up system tray
         self.setup_system_tray()
@@ -1136,26 +2096,13 @@ class DobbyApp:
         print(f"🔌 API: {'Connected' if FIREWORKS_API_KEY and len(FIREWORKS_API_KEY) > 10 else 'Configure in config.py'}")
         print("")
         print("✅ App initialized successfully!")
-        print("🎯 Ready! Press F2 when you have text selected...")
+        print(f"🎯 Ready! Press {self.hotkeys.label('capture')} when you have text selected...")
         print("🔍 Debug mode enabled - watching for issues...")
     
     def setup_hotkeys(self):
-        """Setup global hotkeys using pynput"""
-        def on_press(key):
-            try:
-                # F2 key
-                if key == keyboard.Key.f2:
-                    self.show_menu_hotkey()
-                # ESC key
-                elif key == keyboard.Key.esc:
-                    self.hide_window()
-            except Exception as e:
-                print(f"Hotkey error: {e}")
-        
-        # Start keyboard listener in background thread
-        self.listener = keyboard.Listener(on_press=on_press)
-        self.listener.daemon = True
-        self.listener.start()
+        """Register the global hotkeys - presses are handed to the worker"""
+        self.hotkey_worker.start()
+        self.hotkeys.start()
     
     def setup_system_tray(self):
         """Setup system tray icon with context menu"""
@@ -1206,6 +2153,19 @@ class DobbyApp:
         
         tray_menu.addSeparator()
         
+        # Usage stats - one line per source, refreshed every time the menu opens
+        self.stats_actions = []
+        for source in self.engine.stats_sources() + [self.hotkey_latency, self.window.paste_latency, self.hotkeys,
+                                                     self.hotkey_worker, self.clipboard, self.window.prefetch_stats,
+                                                     self.window.again_latency, self.window.preview_limiter]:
+            action = QAction("", self.app)
+            action.setEnabled(False)
+            tray_menu.addAction(action)
+            self.stats_actions.append((action, source))
+        tray_menu.aboutToShow.connect(self.update_stats)
+        
+        tray_menu.addSeparator()
+        
         # Exit action  
         exit_action = QAction("Exit", self.app)
         exit_action.triggered.connect(self.quit_application)
@@ -1215,7 +2175,7 @@ class DobbyApp:
         self.tray_icon.setContextMenu(tray_menu)
         
         # Set tooltip
-        self.tray_icon.setToolTip("Dobby AI Rephraser - Press F2 to rephrase selected text")
+        self.tray_icon.setToolTip(f"Dobby AI Rephraser - Press {self.hotkeys.label('capture')} to rephrase selected text")
         
         # Handle tray icon activation (double-click)
         self.tray_icon.activated.connect(self.tray_icon_activated)
@@ -1225,6 +2185,11 @@ class DobbyApp:
         
         print("✅ System tray icon created successfully!")
     
+    def update_stats(self):
+        """Refresh the stats lines in the tray menu"""
+        for action, source in self.stats_actions:
+            action.setText(source.stats_text())
+    
     def tray_icon_activated(self, reason):
         """Handle tray icon activation"""
         if reason == QSystemTrayIcon.ActivationReason.DoubleClick:
@@ -1232,6 +2197,7 @@ class DobbyApp:
     
     def show_window(self):
         """Show the main window"""
+        self.window.paste_target = None  # opened from the tray, not captured from an app
         if self.window.isVisible():
             self.window.raise_()
             self.window.activateWindow()
@@ -1243,19 +2209,36 @@ class DobbyApp:
     def quit_application(self):
         """Completely quit the application"""
         print("👋 Exiting Dobby AI Rephraser...")
+        for stats, name in ((self.hotkey_latency, "window"), (self.window.paste_latency, "paste")):
+            print(f"⏱️ {stats.title} {name} latency: " + ", ".join(f"{label}: {count}"
+                                                                  for label, count in stats.histogram(name)))
+        self.hotkeys.stop()
+        self.engine.close()
         self.tray_icon.hide()
         self.app.quit()
         sys.exit(0)
     
-    def show_menu_hotkey(self):
+    def show_menu_hotkey(self, pressed_at=None):
         print("🔥 F2 PRESSED! Starting text capture...")
+        self.hotkey_pressed_at = pressed_at or time.monotonic()
         try:
-            # Auto-copy selected text
+            # Auto-copy selected text, then wait for it to actually reach the clipboard
             print("📋 Sending Ctrl+C...")
-            pyautogui.hotkey('ctrl', 'c')
-            time.sleep(0.3)  # Increased delay
+            previous = self.clipboard.snapshot() if CLIPBOARD_SETTINGS.get("restore", True) else None
+            self.window.paste_target = foreground_window()
+            sequence = self.clipboard.sequence
+            self.injector.hotkey('ctrl', 'c')
+            timeout = CLIPBOARD_SETTINGS.get("copy_timeout_ms", 500) / 1000
+            if self.clipboard.wait_for_change(sequence, timeout):
+                copy_time = time.monotonic() - self.hotkey_pressed_at
+                self.hotkey_latency.record("copy", copy_time)
+                print(f"⏱️ Clipboard changed after {copy_time * 1000:.0f} ms")
+            else:
+                print(f"⏱️ No clipboard change within {timeout * 1000:.0f} ms - reading it anyway")
             
-            current_text = pyperclip.paste()
+            current_text = self.clipboard.text()
+            if previous is not None:
+                self.clipboard.restore(previous)
             print(f"📋 Clipboard content: '{current_text[:100]}...'")
             print(f"📏 Clipboard length: {len(current_text)}")
             
@@ -1277,8 +2260,14 @@ class DobbyApp:
             import traceback
             traceback.print_exc()
     
-    def hide_window(self):
-        self.window.hide()
+    def record_hotkey_latency(self, text):
+        """Runs right after the window has shown the captured text"""
+        if self.hotkey_pressed_at is None:
+            return
+        elapsed = time.monotonic() - self.hotkey_pressed_at
+        self.hotkey_pressed_at = None
+        self.hotkey_latency.record("window", elapsed)
+        print(f"⏱️ F2 to window: {elapsed * 1000:.0f} ms")
     
     def run(self):
         sys.exit(self.app.exec())
@@ -1848,6 +2837,11 @@ def show_api_key_dialog():
     return result == QDialog.DialogCode.Accepted
 
 if __name__ == "__main__":
+    if "--prompt-report" in sys.argv:
+        # Same as `python -m dobby prompt-report`, which needs no display
+        prompt_report(RephraseEngine(), live="--live" in sys.argv and api_key_valid)
+        sys.exit(0)
+    
     # Check if we need to show API key dialog
     if not api_key_valid:
         if not show_api_key_dialog():
@@ -0,0 +1,1577 @@
+#!/usr/bin/env python3
+"""
+Dobby rephrasing engine - everything except the GUI.
+
+Builds requests from WRITING_STYLES, talks to Fireworks (pooled client,
+retries, rate scheduling, streaming, cancellation), caches results and
+splits long texts. Used by the Qt app and usable on its own:
+
+    engine = RephraseEngine()
+    print(engine.rephrase("hello how are you", "friendly"))
+"""
+import sys
+import re
+import json
+import time
+import heapq
+import bisect
+import random
+import asyncio
+import difflib
+import hashlib
+import itertools
+import socket
+import sqlite3
+import threading
+from functools import partial
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeoutError
+import requests
+
+# Defaults come from config.py - every setting can be overridden per engine
+try:
+    from config import FIREWORKS_API_KEY, FIREWORKS_URL, MODEL_NAME, WRITING_STYLES, API_SETTINGS
+except ImportError:
+    FIREWORKS_API_KEY = ""
+    FIREWORKS_URL = "https://api.fireworks.ai/inference/v1/chat/completions"
+    MODEL_NAME = "accounts/fireworks/models/llama-v3p1-70b-instruct"
+    WRITING_STYLES = {}
+    API_SETTINGS = {}
+
+# Optional settings - older config.py files may not have them yet
+try:
+    from config import NETWORK_SETTINGS
+except ImportError:
+    NETWORK_SETTINGS = {}
+
+try:
+    from config import CACHE_SETTINGS
+except ImportError:
+    CACHE_SETTINGS = {}
+
+try:
+    from config import PROMPT_SETTINGS
+except ImportError:
+    PROMPT_SETTINGS = {}
+
+try:
+    from config import CHUNK_SETTINGS
+except ImportError:
+    CHUNK_SETTINGS = {}
+
+try:
+    from config import SEGMENT_CACHE_SETTINGS
+except ImportError:
+    SEGMENT_CACHE_SETTINGS = {}
+
+class ApiError(Exception):
+    """Fireworks returned an error or a response we can't use"""
+
+class GenerationCancelled(Exception):
+    """The generation was cancelled or superseded by a newer one"""
+
+def abort_response(response):
+    """Close a response from another thread. The socket is shut down first -
+    closing alone doesn't wake up a read that is blocked on it."""
+    raw = getattr(response, "raw", None)  # requests -> urllib3 -> http.client reader -> socket
+    reader = getattr(getattr(raw, "_fp", None), "fp", None)
+    sock = getattr(getattr(reader, "raw", None), "_sock", None)
+    if sock is None:
+        sock = getattr(getattr(raw, "connection", None), "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    response.close()
+
+class Generation:
+    """Handle for one in-flight generation.
+    
+    Carries the id used to drop results from superseded sessions and lets
+    the GUI thread cancel the worker, closing any open HTTP response.
+    """
+    _ids = iter(range(1, sys.maxsize))
+    
+    def __init__(self):
+        self.id = next(Generation._ids)
+        self.from_cache = False
+        self.truncated = False  # Cut off by max_tokens even at the configured maximum - never cached
+        self._cancelled = threading.Event()
+        self._responses = []
+        self._lock = threading.Lock()
+    
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+    
+    def cancel(self):
+        self._cancelled.set()
+        with self._lock:
+            responses, self._responses = self._responses, []
+        for response in responses:
+            try:
+                abort_response(response)
+            except Exception:
+                pass
+    
+    def attach(self, response):
+        with self._lock:
+            self._responses.append(response)
+        if self.cancelled:
+            self.cancel()
+    
+    def wait(self, seconds):
+        """Sleep that wakes up early on cancel - returns True if cancelled"""
+        return self._cancelled.wait(seconds)
+    
+    def check(self):
+        if self.cancelled:
+            raise GenerationCancelled()
+
+# Scheduling priorities - lower runs first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+PRIORITY_BATCH = 2
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BACKGROUND: "background", PRIORITY_BATCH: "batch"}
+
+def approx_tokens(text):
+    """~4 characters per token - close enough for budgeting"""
+    return len(text) // 4
+
+def estimate_tokens(payload):
+    """Rough token cost of a request: the prompt plus the output budget of
+    every candidate asked for (n)"""
+    prompt_tokens = sum(approx_tokens(m.get("content", "")) for m in payload.get("messages", []))
+    return prompt_tokens + payload.get("max_tokens", 0) * payload.get("n", 1)
+
+def parse_duration(value):
+    """Seconds from rate-limit reset values like "1s", "6m0s", "20ms" or "0.5" """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|s|m|h)", value or "")
+    return sum(float(number) * units[unit] for number, unit in parts) or None
+
+class RateScheduler:
+    """Client-side request and token budget shared by every request path.
+    
+    Requests wait in a priority queue until the last minute's usage leaves
+    room, so interactive rephrases always go before background and batch
+    work. Limits come from config and are replaced by the x-ratelimit-*
+    headers when the server sends them. 0 means no limit.
+    """
+    WINDOW = 60
+    
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_depth = 0
+        self.waits = {priority: [0, 0.0] for priority in PRIORITY_NAMES}  # count, seconds
+        self._waiting = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._sent = deque()  # (time, tokens)
+        self._paused_until = 0
+        self._cond = threading.Condition()
+    
+    def acquire(self, priority=PRIORITY_INTERACTIVE, tokens=0, generation=None):
+        """Block until this request fits the budget and nothing more urgent is waiting"""
+        entry = (priority, next(self._seq))
+        started = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            self.max_depth = max(self.max_depth, len(self._waiting))
+            try:
+                while True:
+                    if generation and generation.cancelled:
+                        raise GenerationCancelled()
+                    delay = 0.1
+                    if self._waiting[0] == entry:
+                        delay = self._delay(tokens)
+                        if delay <= 0:
+                            break
+                    self._cond.wait(min(delay, 0.1))
+            except GenerationCancelled:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                raise
+            
+            heapq.heappop(self._waiting)
+            self._sent.append((time.monotonic(), tokens))
+            waited = time.monotonic() - started
+            self.waits[priority][0] += 1
+            self.waits[priority][1] += waited
+            self._cond.notify_all()
+        
+        if waited > 0.05:
+            print(f"⏳ Waited {waited * 1000:.0f} ms for rate budget ({PRIORITY_NAMES[priority]})")
+    
+    def _delay(self, tokens):
+        """Seconds until a request of this size fits the budget"""
+        now = time.monotonic()
+        while self._sent and now - self._sent[0][0] >= self.WINDOW:
+            self._sent.popleft()
+        
+        delay = self._paused_until - now
+        if self.requests_per_minute and len(self._sent) >= self.requests_per_minute:
+            delay = max(delay, self._sent[0][0] + self.WINDOW - now)
+        if self.tokens_per_minute and self._sent:
+            excess = sum(t for _, t in self._sent) + tokens - self.tokens_per_minute
+            for sent_at, sent_tokens in self._sent:
+                if excess <= 0:
+                    break
+                excess -= sent_tokens
+                delay = max(delay, sent_at + self.WINDOW - now)
+        return delay
+    
+    def observe(self, response):
+        """Learn limits from x-ratelimit-* headers and back off on 429"""
+        headers = response.headers
+        with self._cond:
+            for header, attr in (("x-ratelimit-limit-requests", "requests_per_minute"),
+                                 ("x-ratelimit-limit-tokens", "tokens_per_minute")):
+                try:
+                    setattr(self, attr, int(float(headers.get(header))))
+                except (TypeError, ValueError):
+                    pass
+            
+            pause = None
+            if headers.get("x-ratelimit-remaining-requests") == "0":
+                pause = parse_duration(headers.get("x-ratelimit-reset-requests")) or 1
+            if response.status_code == 429:
+                pause = parse_duration(headers.get("retry-after")) or 1
+            if pause:
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+    
+    def queue_depth(self):
+        with self._cond:
+            return len(self._waiting)
+    
+    def stats_text(self):
+        waits = ", ".join(f"{PRIORITY_NAMES[p]} {seconds * 1000 / count:.0f} ms"
+                          for p, (count, seconds) in self.waits.items() if count)
+        return f"Queue: {self.queue_depth()} waiting (max {self.max_depth}), avg wait: {waits or '-'}"
+
+class CircuitBreaker:
+    """Stops calling an endpoint after repeated failures.
+    
+    Opens after `threshold` consecutive failures, fails fast for `cooldown`
+    seconds, then lets one probe request through (half-open). A probe that
+    ends without a verdict (cancelled) must release() its slot.
+    """
+    def __init__(self, threshold=5, cooldown=30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+        self._probing = False
+        self._prober = None
+        self._lock = threading.Lock()
+    
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.cooldown and not self._probing:
+                self._probing = True
+                self._prober = threading.get_ident()
+                return True
+            return False
+    
+    def release(self):
+        """The calling thread's probe ended without success or failure - let the next request probe"""
+        with self._lock:
+            if self._probing and self._prober == threading.get_ident():
+                self._probing = False
+    
+    def retry_in(self):
+        if self.opened_at is None:
+            return 0
+        return max(0, self.cooldown - (time.monotonic() - self.opened_at))
+    
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or (self.opened_at is None and self.failures >= self.threshold):
+                if not self._probing:
+                    self.trips += 1
+                    print(f"🔌 Circuit opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+class ApiClient:
+    """Shared HTTP client for Fireworks calls.
+
+    Keeps a pool of keep-alive connections so each generation skips the
+    DNS/TCP/TLS handshake. Uses httpx with HTTP/2 when enabled and installed,
+    otherwise a requests.Session. Safe to share between worker threads.
+    
+    Transient failures (network errors, 429, 5xx) are retried with jittered
+    exponential backoff that honours Retry-After, behind a per-endpoint
+    circuit breaker.
+    """
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    
+    def __init__(self, pool_size=10, timeout=30, http2=False, retries=3, backoff_base=0.5,
+                 backoff_max=8, breaker_threshold=5, breaker_cooldown=30,
+                 requests_per_minute=0, tokens_per_minute=0):
+        self.timeout = timeout
+        self.scheduler = RateScheduler(requests_per_minute, tokens_per_minute)
+        self.http2 = False
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.requests_sent = 0
+        self.retries_done = 0
+        self._breakers = {}
+        self._lock = threading.Lock()
+        
+        if http2:
+            try:
+                import httpx
+                limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+                self._session = httpx.Client(http2=True, limits=limits, timeout=timeout)
+                self.http2 = True
+            except ImportError:
+                print("⚠️ HTTP/2 needs httpx[http2] - falling back to requests")
+        
+        if not self.http2:
+            self._session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            self._session.mount("https://", adapter)
+            self._session.mount("http://", adapter)
+    
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(pool_size=settings.get("pool_size", 10),
+                   timeout=settings.get("timeout", 30),
+                   http2=settings.get("http2", False),
+                   retries=settings.get("retries", 3),
+                   backoff_base=settings.get("backoff_base", 0.5),
+                   backoff_max=settings.get("backoff_max", 8),
+                   breaker_threshold=settings.get("breaker_threshold", 5),
+                   breaker_cooldown=settings.get("breaker_cooldown", 30),
+                   requests_per_minute=settings.get("requests_per_minute", 0),
+                   tokens_per_minute=settings.get("tokens_per_minute", 0))
+    
+    def breaker(self, url):
+        with self._lock:
+            if url not in self._breakers:
+                self._breakers[url] = CircuitBreaker(self.breaker_threshold, self.breaker_cooldown)
+            return self._breakers[url]
+    
+    def post(self, url, payload, headers=None, timeout=None, stream=False, generation=None,
+             priority=PRIORITY_INTERACTIVE):
+        """POST payload as JSON, retrying transient failures.
+        
+        Every attempt first waits for the rate scheduler. The response is
+        attached to the generation handle before its body is read (or
+        streamed), so cancelling aborts the transfer. Returns the last
+        response even if it is an error; raises ApiError while the circuit
+        is open.
+        """
+        breaker = self.breaker(url)
+        body = json.dumps(payload)
+        tokens = estimate_tokens(payload)
+        attempt = 0
+        
+        try:
+            while True:
+                if generation:
+                    generation.check()
+                if breaker.retry_in() > 0:
+                    raise ApiError(f"Fireworks is failing, paused for {breaker.retry_in():.0f}s - try again shortly")
+                
+                # Rate budget first - a half-open probe slot isn't held while queued
+                self.scheduler.acquire(priority, tokens, generation)
+                if not breaker.allow():
+                    raise ApiError(f"Fireworks is failing, paused for {breaker.retry_in():.0f}s - try again shortly")
+                with self._lock:
+                    self.requests_sent += 1
+                try:
+                    response = self._send(url, body, headers, timeout)
+                    if generation:
+                        generation.attach(response)
+                    if not stream:
+                        self._read(response)
+                # ValueError / AttributeError: http.client when a cancel closes the response mid-read
+                except (requests.RequestException, OSError, ValueError, AttributeError) + self._transport_errors() as e:
+                    if generation and generation.cancelled:
+                        raise GenerationCancelled()  # Closed under us - not the endpoint's fault
+                    breaker.record_failure()
+                    if attempt >= self.retries:
+                        raise
+                    delay = self.backoff_delay(attempt)
+                    print(f"🔁 {type(e).__name__}, retrying in {delay:.1f}s")
+                else:
+                    self.scheduler.observe(response)
+                    if generation:
+                        generation.check()
+                    if response.status_code not in self.RETRY_STATUSES:
+                        breaker.record_success()
+                        return response
+                    if response.status_code >= 500:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()  # 429 - alive, just busy
+                    if attempt >= self.retries:
+                        return response
+                    delay = self.backoff_delay(attempt, response.headers.get("retry-after"))
+                    print(f"🔁 HTTP {response.status_code}, retrying in {delay:.1f}s")
+                    response.close()
+                
+                attempt += 1
+                with self._lock:
+                    self.retries_done += 1
+                if generation:
+                    if generation.wait(delay):
+                        raise GenerationCancelled()
+                else:
+                    time.sleep(delay)
+        finally:
+            breaker.release()  # No-op unless this call was a probe that got cancelled
+    
+    def backoff_delay(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff; Retry-After (seconds) wins when given"""
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max * 4)
+            except ValueError:
+                pass  # HTTP-date form - fall back to our own schedule
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+    
+    def _send(self, url, body, headers, timeout):
+        """Send and return once the headers are in - the body is read later"""
+        if self.http2:
+            request = self._session.build_request("POST", url, headers=headers, content=body,
+                                                  timeout=timeout or self.timeout)
+            return self._session.send(request, stream=True)
+        return self._session.post(url, headers=headers, data=body,
+                                  timeout=timeout or self.timeout, stream=True)
+    
+    def _read(self, response):
+        """Read the whole body of a response sent with _send()"""
+        if self.http2:
+            response.read()
+        else:
+            response.content  # Loads and keeps the body
+    
+    def _transport_errors(self):
+        if self.http2:
+            import httpx
+            return (httpx.TransportError,)
+        return ()
+    
+    def error_text(self, response):
+        """Body of an error response, also for streamed responses"""
+        if self.http2:
+            response.read()
+        return response.text
+    
+    def iter_lines(self, response):
+        """Iterate decoded lines of a streamed response"""
+        if self.http2:
+            yield from response.iter_lines()
+        else:
+            response.encoding = "utf-8"
+            yield from response.iter_lines(decode_unicode=True)
+    
+    def stats_text(self):
+        trips = sum(b.trips for b in list(self._breakers.values()))
+        return f"Network: {self.requests_sent} requests, {self.retries_done} retries, {trips} circuit trips"
+    
+    def close(self):
+        self._session.close()
+
+def split_prompt(style_data):
+    """(system instructions, user template) for a style.
+    
+    Older configs keep everything in "prompt"; those are split at the line
+    holding {input_text} so the instructions still become a stable prefix.
+    """
+    if "system" in style_data:
+        return style_data["system"].strip(), style_data["prompt"]
+    prompt = style_data["prompt"]
+    line_start = prompt.rfind("\n", 0, prompt.find("{input_text}")) + 1
+    return prompt[:line_start].strip(), prompt[line_start:]
+
+def split_paragraphs(text):
+    """(paragraph, separator) pairs split at blank lines; joining
+    paragraph + separator for all of them gives back the text exactly"""
+    parts = re.split(r"(\n[ \t]*\n\s*)", text)
+    return list(zip(parts[0::2], parts[1::2] + [""]))
+
+def split_chunks(text, max_chars=800):
+    """Split long text into parts at paragraph boundaries, and at sentence
+    boundaries inside paragraphs that are too long on their own.
+    
+    Returns (part, separator) pairs; joining part + separator for all of
+    them gives back the original text exactly.
+    """
+    units = []
+    for paragraph, separator in split_paragraphs(text):
+        if len(paragraph) <= max_chars:
+            units.append((paragraph, separator))
+            continue
+        sentences = re.split(r"(?<=[.!?])([ \t]+)", paragraph)
+        pieces = list(zip(sentences[0::2], sentences[1::2] + [""]))
+        pieces[-1] = (pieces[-1][0], pieces[-1][1] + separator)
+        units.extend(pieces)
+    
+    # Merge neighbours back together up to max_chars - fewer, fuller requests
+    chunks = []
+    for part, separator in units:
+        if chunks and len(chunks[-1][0]) + len(chunks[-1][1]) + len(part) <= max_chars:
+            previous, previous_separator = chunks[-1]
+            chunks[-1] = (previous + previous_separator + part, separator)
+        else:
+            chunks.append((part, separator))
+    return chunks
+
+# Leading indentation plus an optional bullet or list number
+LINE_PREFIX = re.compile(r"^[ \t]*(?:(?:[-*•–]|\d+[.)])[ \t]+)?")
+
+# Sentence ends followed by spaces, and line breaks
+SEGMENT_BREAK = re.compile(r"((?<=[.!?])[ \t]+|[ \t]*\n\s*)")
+
+# Put in front of the numbered sentences sent by rephrase_segments()
+SEGMENT_INSTRUCTIONS = ("The text below is split into numbered lines. Rephrase every line on its own line, "
+                        "keep its [number] in front and don't merge, split or skip lines.")
+
+def split_segments(text):
+    """(segment, separator) pairs at sentence ends and line breaks; joining
+    segment + separator for all of them gives back the text exactly"""
+    parts = SEGMENT_BREAK.split(text)
+    return list(zip(parts[0::2], parts[1::2] + [""]))
+
+def restore_layout(original, rephrased):
+    """Put the original's blank lines, indentation and bullet markers back.
+    
+    Only applied when the model kept the same line structure; otherwise the
+    rephrased text is returned as-is.
+    """
+    original_lines = original.split("\n")
+    rephrased_lines = rephrased.split("\n")
+    if len(original_lines) != len(rephrased_lines):
+        return rephrased
+    
+    lines = []
+    for original_line, rephrased_line in zip(original_lines, rephrased_lines):
+        if not original_line.strip() or not rephrased_line.strip():
+            if original_line.strip() or rephrased_line.strip():
+                return rephrased  # Blank lines moved - structure differs
+            lines.append(original_line)
+            continue
+        prefix = LINE_PREFIX.match(original_line).group(0)
+        body = rephrased_line[LINE_PREFIX.match(rephrased_line).end():].strip()
+        trailing = original_line[len(original_line.rstrip()):]
+        lines.append(prefix + body + trailing)
+    return "\n".join(lines)
+
+def finish_reason(result):
+    choices = result.get('choices') or [{}]
+    return choices[0].get('finish_reason')
+
+def parse_completion(result, stats=None):
+    if 'choices' in result and len(result['choices']) > 0:
+        if stats:
+            stats.record(result['choices'][0].get('finish_reason'))
+        return result['choices'][0]['message']['content'].strip()
+    raise ApiError("Invalid API response format")
+
+def parse_choices(result, stats=None):
+    """Every distinct text of a completion asked for several candidates (n)"""
+    choices = sorted(result.get('choices') or [], key=lambda choice: choice.get('index', 0))
+    if not choices:
+        raise ApiError("Invalid API response format")
+    texts = []
+    for choice in choices:
+        if stats:
+            stats.record(choice.get('finish_reason'))
+        if choice.get('finish_reason') == "length":
+            continue  # Cut off - not worth offering
+        text = choice['message']['content'].strip()
+        if text and text not in texts:
+            texts.append(text)
+    return texts
+
+class CompletionStats:
+    """Counts how often generations run into the max_tokens budget"""
+    def __init__(self):
+        self.completions = 0
+        self.budget_hits = 0
+        self._lock = threading.Lock()
+    
+    def record(self, finish_reason):
+        with self._lock:
+            self.completions += 1
+            if finish_reason == "length":
+                self.budget_hits += 1
+                print(f"✂️ Generation hit its max_tokens budget ({self.budget_hits} of {self.completions})")
+    
+    def stats_text(self):
+        return f"Output budget: hit by {self.budget_hits} of {self.completions} generations"
+
+class EditStats:
+    """How much of edited texts was reused instead of rephrased again"""
+    def __init__(self):
+        self.edits = 0
+        self.reused = 0
+        self.sent = 0
+        self.tokens_saved = 0
+        self._lock = threading.Lock()
+    
+    def record(self, reused, sent, tokens_saved):
+        with self._lock:
+            self.edits += 1
+            self.reused += reused
+            self.sent += sent
+            self.tokens_saved += tokens_saved
+    
+    def stats_text(self):
+        return (f"Edits: {self.reused} of {self.reused + self.sent} paragraphs reused "
+                f"in {self.edits} regenerations, ~{self.tokens_saved} tokens saved")
+
+class SegmentStats:
+    """Sentence cache hit ratio and what it saved"""
+    def __init__(self):
+        self.segments = 0
+        self.hits = 0
+        self.requests = 0
+        self.fallbacks = 0
+        self.tokens_saved = 0
+        self._lock = threading.Lock()
+    
+    def record(self, segments, hits, tokens_saved, requested):
+        with self._lock:
+            self.segments += segments
+            self.hits += hits
+            self.tokens_saved += tokens_saved
+            self.requests += requested
+    
+    def fallback(self):
+        with self._lock:
+            self.fallbacks += 1
+    
+    def stats_text(self):
+        rate = f"{self.hits * 100 // self.segments}%" if self.segments else "-"
+        return (f"Sentences: {self.hits} of {self.segments} from cache ({rate}), ~{self.tokens_saved} tokens saved, "
+                f"{self.requests} combined requests, {self.fallbacks} fell back to the whole text")
+
+class LatencyStats:
+    """Latency percentiles per name (route, step...) over the last `keep` samples"""
+    def __init__(self, title="Latency", keep=1000):
+        self.title = title
+        self.keep = keep
+        self.counts = {}
+        self._samples = {}
+        self._lock = threading.Lock()
+    
+    def record(self, name, seconds):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+            self._samples.setdefault(name, deque(maxlen=self.keep)).append(seconds)
+    
+    def percentiles(self, name, points=(50, 90, 99)):
+        """{point: milliseconds} for one name, empty if nothing was recorded"""
+        with self._lock:
+            samples = sorted(self._samples.get(name, ()))
+        if not samples:
+            return {}
+        return {p: samples[min(len(samples) - 1, len(samples) * p // 100)] * 1000 for p in points}
+    
+    def histogram(self, name, bounds_ms=(25, 50, 100, 200, 400, 800)):
+        """[(label, count)] buckets of the recorded samples, e.g. ("<50 ms", 12)"""
+        with self._lock:
+            samples = list(self._samples.get(name, ()))
+        labels = [f"<{bound} ms" for bound in bounds_ms] + [f">={bounds_ms[-1]} ms"]
+        counts = [0] * len(labels)
+        for seconds in samples:
+            counts[bisect.bisect_right(bounds_ms, seconds * 1000)] += 1
+        return list(zip(labels, counts))
+    
+    def summary(self):
+        """{name: {"count": n, "p50_ms": ..., "p90_ms": ..., "p99_ms": ...}}"""
+        with self._lock:
+            names = list(self.counts)
+        result = {}
+        for name in names:
+            result[name] = {"count": self.counts[name]}
+            result[name].update({f"p{p}_ms": round(ms, 1) for p, ms in self.percentiles(name).items()})
+        return result
+    
+    def stats_text(self):
+        parts = [f"{name} p50 {row.get('p50_ms', 0):.0f} / p90 {row.get('p90_ms', 0):.0f} / "
+                 f"p99 {row.get('p99_ms', 0):.0f} ms ({row['count']})" for name, row in self.summary().items()]
+        return f"{self.title}: {'; '.join(parts) or '-'}"
+
+def cache_key(payload):
+    """Hash of model, prompt (template + input text) and API settings"""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """Rephrase results cache: in-memory LRU in front of a SQLite file.
+    
+    Entries expire after ttl_days and the file is trimmed to max_entries,
+    least recently used first. Thread-safe.
+    """
+    def __init__(self, path="", memory_items=200, max_entries=5000, ttl_days=30, enabled=True):
+        self.enabled = enabled
+        self.memory_items = memory_items
+        self.max_entries = max_entries
+        self.ttl = ttl_days * 24 * 3600
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        
+        if enabled and path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY, text TEXT, created REAL, used REAL)""")
+                self._db.execute("CREATE INDEX IF NOT EXISTS responses_used ON responses (used)")
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"⚠️ Disk cache unavailable ({e}), using memory only")
+                self._db = None
+    
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(path=settings.get("path", "dobby_cache.db"),
+                   memory_items=settings.get("memory_items", 200),
+                   max_entries=settings.get("max_entries", 5000),
+                   ttl_days=settings.get("ttl_days", 30),
+                   enabled=settings.get("enabled", True))
+    
+    def get(self, key):
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry[1] < self.ttl:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry[0]
+            
+            if self._db:
+                row = self._db.execute("SELECT text, created FROM responses WHERE key = ? AND created > ?",
+                                       (key, now - self.ttl)).fetchone()
+                if row:
+                    self._db.execute("UPDATE responses SET used = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self._remember(key, row[0], row[1])
+                    self.disk_hits += 1
+                    return row[0]
+            
+            self.misses += 1
+            return None
+    
+    def put(self, key, text):
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            self._remember(key, text, now)
+            if self._db:
+                try:
+                    self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, text, now, now))
+                    self._db.execute("DELETE FROM responses WHERE created <= ?", (now - self.ttl,))
+                    self._db.execute("""DELETE FROM responses WHERE key IN (
+                        SELECT key FROM responses ORDER BY used DESC LIMIT -1 OFFSET ?)""", (self.max_entries,))
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    print(f"⚠️ Disk cache write failed: {e}")
+    
+    def _remember(self, key, text, created):
+        self._memory[key] = (text, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+    
+    def stats_text(self):
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        rate = f"{hits * 100 // total}%" if total else "-"
+        return f"Cache: {hits} hits ({self.disk_hits} from disk), {self.misses} misses, {rate} hit rate"
+    
+    def close(self):
+        if self._db:
+            self._db.close()
+
+def iter_sse_deltas(lines, stats=None, on_finish=None):
+    """Yield content deltas from a chat completions server-sent event stream.
+    
+    on_finish(finish_reason) is called when the stream says why it ended.
+    """
+    for line in lines:
+        if not line or not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        choices = json.loads(data).get("choices") or []
+        if choices:
+            delta = (choices[0].get("delta") or {}).get("content")
+            if delta:
+                yield delta
+            if choices[0].get("finish_reason"):
+                if stats:
+                    stats.record(choices[0]["finish_reason"])
+                if on_finish:
+                    on_finish(choices[0]["finish_reason"])
+
+class SingleFlight:
+    """Identical requests in flight share one upstream call.
+    
+    The first caller for a key runs the call; everyone asking for the same
+    key meanwhile waits for its result or error. A waiter whose own
+    generation is cancelled stops waiting. If the running call was the one
+    cancelled, its waiters start over instead of failing with it.
+    """
+    def __init__(self):
+        self.calls = 0
+        self.saved = 0
+        self._inflight = {}  # key -> Future
+        self._lock = threading.Lock()
+    
+    def run(self, key, function, generation=None):
+        while True:
+            with self._lock:
+                future = self._inflight.get(key)
+                leader = future is None
+                if leader:
+                    future = self._inflight[key] = Future()
+                    self.calls += 1
+                else:
+                    self.saved += 1
+            
+            if leader:
+                # Unregistered before waiters wake up, so a retrying waiter never finds the old call
+                try:
+                    result = function()
+                except BaseException as e:
+                    self._finish(key)
+                    future.set_exception(e)
+                    raise
+                self._finish(key)
+                future.set_result(result)
+                return result
+            
+            print("🔗 Same request already running - waiting for its result")
+            try:
+                while True:
+                    try:
+                        return future.result(timeout=0.1)
+                    except FutureTimeoutError:
+                        if generation:
+                            generation.check()
+            except GenerationCancelled:
+                if generation and generation.cancelled:
+                    raise
+                # The call we waited for was cancelled by its owner - run it ourselves
+                with self._lock:
+                    self.saved -= 1
+    
+    def _finish(self, key):
+        with self._lock:
+            del self._inflight[key]
+    
+    def stats_text(self):
+        return f"Single-flight: {self.saved} calls saved, {self.calls} sent"
+
+class EngineLoop:
+    """One background asyncio loop that every request runs on.
+    
+    submit() is safe to call from any thread and returns a
+    concurrent.futures.Future. At most max_concurrent calls run at once -
+    the rest wait on the loop without holding a thread, in priority order
+    like RateScheduler. reserved_interactive slots are kept free for
+    interactive calls, so background and batch work can never fill the
+    loop; 0 lets a batch run use every slot. Blocking HTTP I/O
+    runs on the loop's own executor, which is sized to max_concurrent so it
+    never opens more connections than the client pool keeps alive.
+    """
+    def __init__(self, max_concurrent=8, reserved_interactive=0):
+        self.max_concurrent = max(1, max_concurrent)
+        self.reserved = max(0, min(reserved_interactive, self.max_concurrent - 1))  # Slots only interactive calls may take
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix="dobby-io")
+        self.loop.set_default_executor(self.executor)
+        self.running = 0
+        self.waiting = 0
+        self.peak = 0
+        self.done = 0
+        self.cancelled = 0
+        self._waiting = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+    
+        started = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(started,), name="dobby-engine", daemon=True)
+        self._thread.start()
+        started.wait()
+    
+    def _run(self, started):
+        asyncio.set_event_loop(self.loop)
+        started.set()
+        self.loop.run_forever()
+    
+    def _fits(self, priority):
+        free = self.max_concurrent - self.running
+        return free > (0 if priority == PRIORITY_INTERACTIVE else self.reserved)
+    
+    def _wake(self):
+        """Hand free slots to the most urgent waiters"""
+        while self._waiting:
+            priority, _, waiter = self._waiting[0]
+            if waiter.done():
+                heapq.heappop(self._waiting)
+                continue
+            if not self._fits(priority):
+                break
+            heapq.heappop(self._waiting)
+            self.running += 1
+            waiter.set_result(None)
+    
+    async def _acquire(self, priority):
+        waiter = self.loop.create_future()
+        heapq.heappush(self._waiting, (priority, next(self._seq), waiter))
+        self._wake()
+        if waiter.done():
+            return
+        
+        self.waiting += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted a slot just before the cancel landed - pass it on
+                self.running -= 1
+                self._wake()
+            raise
+        finally:
+            self.waiting -= 1
+    
+    async def _call(self, priority, function, args, kwargs):
+        # Counters and the wait queue are only touched on the loop thread
+        try:
+            await self._acquire(priority)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        
+        self.peak = max(self.peak, self.running)
+        try:
+            return await function(*args, **kwargs)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.running -= 1
+            self.done += 1
+            self._wake()
+    
+    def submit(self, function, *args, priority=PRIORITY_INTERACTIVE, **kwargs):
+        """Run the coroutine function on the loop; returns a concurrent Future"""
+        return asyncio.run_coroutine_threadsafe(self._call(priority, function, args, kwargs), self.loop)
+    
+    def stats_text(self):
+        return (f"Engine: {self.running} running, {self.waiting} waiting, "
+                f"peak {self.peak}/{self.max_concurrent}, {self.done} done, {self.cancelled} cancelled")
+    
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=2)
+        self.executor.shutdown(wait=False)
+
+class RephraseEngine:
+    """Rephrase text in one of WRITING_STYLES - no Qt required.
+    
+    Every argument defaults to the matching value from config.py. The
+    engine owns the pooled ApiClient (with its retries and rate scheduler),
+    the response cache and the pool for long-text parts, so create one and
+    share it. rephrase() is blocking and thread-safe; arephrase() is the
+    same call for asyncio code, and submit() runs it on the engine's own
+    loop with bounded concurrency and hands back a future.
+    """
+    def __init__(self, api_key=None, url=None, model=None, styles=None, api_settings=None,
+                 network_settings=None, prompt_settings=None, cache_settings=None,
+                 chunk_settings=None, segment_settings=None, client=None, cache=None):
+        self.api_key = FIREWORKS_API_KEY if api_key is None else api_key
+        self.url = url or FIREWORKS_URL
+        self.model = model or MODEL_NAME
+        self.styles = WRITING_STYLES if styles is None else styles
+        self.api_settings = API_SETTINGS if api_settings is None else api_settings
+        self.network_settings = NETWORK_SETTINGS if network_settings is None else network_settings
+        self.prompt_settings = PROMPT_SETTINGS if prompt_settings is None else prompt_settings
+        self.chunk_settings = CHUNK_SETTINGS if chunk_settings is None else chunk_settings
+        self.segment_settings = SEGMENT_CACHE_SETTINGS if segment_settings is None else segment_settings
+        
+        self.client = client or ApiClient.from_settings(self.network_settings)
+        self.cache = cache or ResponseCache.from_settings(CACHE_SETTINGS if cache_settings is None else cache_settings)
+        self.completion_stats = CompletionStats()
+        self.edit_stats = EditStats()
+        self.segment_stats = SegmentStats()
+        self.flights = SingleFlight()
+        self.chunk_pool = ThreadPoolExecutor(max_workers=self.chunk_settings.get("max_workers", 4))
+        self._runner = None
+        self._runner_lock = threading.Lock()
+    
+    @property
+    def has_api_key(self):
+        return bool(self.api_key) and len(self.api_key) >= 10
+    
+    def stats_sources(self):
+        """Objects with a stats_text() - shown in the tray menu, printed by tools"""
+        return [self.cache, self.flights, self.client, self.client.scheduler, self.completion_stats,
+                self.edit_stats, self.segment_stats, self.runner]
+    
+    @property
+    def runner(self):
+        """The EngineLoop behind submit(), started on first use"""
+        with self._runner_lock:
+            if self._runner is None:
+                self._runner = EngineLoop(self.network_settings.get("max_concurrent", 8),
+                                          self.network_settings.get("reserved_interactive", 0))
+            return self._runner
+    
+    # --- Request building ---
+    
+    def style_messages(self, text, style, context=None):
+        """System + user messages for rephrasing text in one of the styles.
+        
+        The instructions never change between calls, so they go first as the
+        system message where provider-side prompt caching can reuse them. Very
+        short inputs get the style's compact instructions when it has them.
+        context is (text before, text after) for one part of a longer text.
+        """
+        style_data = self.styles[style]
+        system, template = split_prompt(style_data)
+        if "compact" in style_data and len(text.split()) <= self.prompt_settings.get("compact_max_words", 12):
+            system = style_data["compact"].strip()
+        
+        user = template.format(input_text=text)
+        if context and any(context):
+            before, after = context
+            user = ("CONTEXT - the text around the part to rephrase. Do NOT rephrase or repeat it:\n"
+                    f"BEFORE: ...{before}\nAFTER: {after}...\n\n{user}")
+        return [
+            {"role": "system", "content": system},
+            {"role": "user", "content": user}
+        ]
+    
+    def output_budget(self, text, style):
+        """max_tokens for one request - a rephrase is about as long as its input.
+        
+        Scales the input's token estimate by the style's output_ratio (some
+        styles expand more), never below output_min_tokens and never above
+        API_SETTINGS["max_tokens"].
+        """
+        ratio = self.styles[style].get("output_ratio", self.prompt_settings.get("output_ratio", 2.5))
+        budget = max(self.prompt_settings.get("output_min_tokens", 64), int(approx_tokens(text) * ratio))
+        return min(budget, self.api_settings.get("max_tokens", 2048))
+    
+    def stop_sequences(self, text):
+        """Stops that end the model's rambling after the rephrase - minus any
+        that appear in the text itself, so real content is never cut"""
+        return [stop for stop in self.prompt_settings.get("stop", []) if stop not in text]
+    
+    def build_payload(self, text, style, context=None):
+        """Chat completions payload for rephrasing text in one of the styles"""
+        payload = {
+            "model": self.model,
+            "messages": self.style_messages(text, style, context),
+            **self.api_settings,
+            "max_tokens": self.output_budget(text, style)
+        }
+        stops = self.stop_sequences(text)
+        if stops:
+            payload["stop"] = stops
+        return payload
+    
+    def headers(self):
+        return {
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+    
+    # --- Calling the API ---
+    
+    def rephrase(self, text, style, generation=None, priority=PRIORITY_INTERACTIVE,
+                 bypass_cache=False, stream=None, on_delta=None, on_progress=None, previous=None):
+        """Rephrase text and return the result.
+        
+        generation - Generation handle for cancelling (one is made if omitted);
+                     generation.from_cache tells whether the cache answered
+        stream     - stream the reply (default from NETWORK_SETTINGS); batched
+                     deltas go to on_delta(text) as they arrive
+        on_progress(message) - progress of long texts rephrased in parts
+        previous   - (text, result) of an earlier rephrase in the same style;
+                     paragraphs that haven't changed since keep their result
+                     (ignored with bypass_cache)
+        
+        Raises ApiError, GenerationCancelled or the network error.
+        """
+        if not self.has_api_key:
+            raise ApiError("Please configure API key in config.py")
+        if style not in self.styles:
+            raise ApiError(f"Unknown writing style: {style}")
+        generation = generation or Generation()
+        
+        payload = self.build_payload(text, style)
+        key = cache_key(payload)
+        if not bypass_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                generation.from_cache = True
+                return cached
+        
+        if stream is None:
+            stream = self.network_settings.get("stream", True)
+        
+        def generate():
+            generated_text = None
+            if previous and not bypass_cache:
+                generated_text = self.rephrase_edited(text, style, *previous, generation, priority, on_progress)
+            if generated_text is None and self.segment_settings.get("enabled", False):
+                generated_text = self.rephrase_segments(text, style, generation, priority, bypass_cache)
+            if generated_text is not None:
+                if not generation.truncated:
+                    self.cache.put(key, generated_text)
+                return generated_text
+            
+            if self.chunk_settings.get("enabled", True) and len(text) >= self.chunk_settings.get("min_chars", 1500):
+                generated_text = self.rephrase_chunks(text, style, generation, priority, bypass_cache, on_progress)
+            elif stream:
+                generated_text = self.stream_completion(payload, generation, on_delta, priority)
+                if generated_text is None:
+                    print("⚠️ Streaming unavailable, falling back to a regular request")
+            if generated_text is None:
+                generated_text = self.complete(payload, generation, priority)
+            
+            if not generation.truncated:
+                self.cache.put(key, generated_text)
+            return generated_text
+        
+        if bypass_cache:
+            return generate()  # "Again" wants its own fresh version
+        # Waiters get the finished text in one piece rather than as deltas
+        return self.flights.run(key, generate, generation)
+    
+    async def arephrase(self, text, style, **options):
+        """rephrase() for asyncio code - runs on the default executor"""
+        return await self._in_executor(self.rephrase, text, style, options)
+    
+    async def _in_executor(self, function, text, style, options):
+        loop = asyncio.get_running_loop()
+        generation = options.setdefault("generation", Generation())
+        generation.check()
+        try:
+            return await loop.run_in_executor(None, partial(function, text, style, **options))
+        except asyncio.CancelledError:
+            generation.cancel()
+            raise
+    
+    def submit(self, text, style, **options):
+        """Queue rephrase() on the engine loop from any thread.
+        
+        Takes the same options as rephrase() and returns a
+        concurrent.futures.Future with the text. Cancelling the future, or
+        the generation, stops the request whether it is waiting or running.
+        """
+        return self._submit(self.rephrase, text, style, options)
+    
+    def submit_alternatives(self, text, style, **options):
+        """submit() for alternatives() - the Future holds the list of candidates"""
+        return self._submit(self.alternatives, text, style, options, PRIORITY_BACKGROUND)
+    
+    def _submit(self, function, text, style, options, priority=PRIORITY_INTERACTIVE):
+        generation = options.setdefault("generation", Generation())
+        future = self.runner.submit(self._in_executor, function, text, style, options,
+                                    priority=options.get("priority", priority))
+        future.add_done_callback(lambda done: done.cancelled() and generation.cancel())
+        return future
+    
+    def alternatives(self, text, style, count=2, generation=None, priority=PRIORITY_BACKGROUND,
+                     bypass_cache=False, temperature=None):
+        """Up to `count` different rephrases from one request (the API's n).
+        
+        The prompt is sent and paid for once. The list is cached under its own
+        key, so the same text and style get their alternatives back without a
+        call; bypass_cache asks for a fresh set. temperature overrides
+        API_SETTINGS so the candidates actually differ. Texts long enough to
+        be rephrased in parts get [] - each alternative would be a full rephrase.
+        """
+        if not self.has_api_key:
+            raise ApiError("Please configure API key in config.py")
+        if style not in self.styles:
+            raise ApiError(f"Unknown writing style: {style}")
+        if self.chunk_settings.get("enabled", True) and len(text) >= self.chunk_settings.get("min_chars", 1500):
+            return []
+        generation = generation or Generation()
+        
+        payload = self.build_payload(text, style)
+        payload["n"] = count
+        if temperature is not None:
+            payload["temperature"] = temperature
+        key = cache_key(payload)
+        if not bypass_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                generation.from_cache = True
+                return json.loads(cached)
+        
+        def generate():
+            response = self.client.post(self.url, payload, headers=self.headers(),
+                                        generation=generation, priority=priority)
+            if response.status_code != 200:
+                raise ApiError(f"API Error {response.status_code}: {response.text}")
+            candidates = parse_choices(response.json(), self.completion_stats)
+            self.cache.put(key, json.dumps(candidates))
+            return candidates
+        
+        if bypass_cache:
+            return generate()
+        return self.flights.run(key, generate, generation)
+    
+    def complete(self, payload, generation=None, priority=PRIORITY_INTERACTIVE):
+        """Blocking non-streaming request - returns the text or raises ApiError.
+        
+        A reply cut off by the adaptive output budget is asked for again with
+        the configured max_tokens (see retry_truncated).
+        """
+        response = self.client.post(self.url, payload, headers=self.headers(),
+                                    generation=generation, priority=priority)
+        if response.status_code != 200:
+            raise ApiError(f"API Error {response.status_code}: {response.text}")
+        result = response.json()
+        text = parse_completion(result, self.completion_stats)
+        if finish_reason(result) == "length":
+            return self.retry_truncated(payload, text, generation, priority)
+        return text
+    
+    def retry_truncated(self, payload, text, generation, priority=PRIORITY_INTERACTIVE):
+        """Handle a reply that ran into max_tokens.
+        
+        Paste replaces the user's whole text, so a cut-off rephrase must not
+        pass as complete. If the request used less than API_SETTINGS
+        max_tokens it is sent again with the full budget. Otherwise, or if
+        that is cut off too, generation.truncated is set - the result is
+        shown as cut off and never cached.
+        """
+        limit = self.api_settings.get("max_tokens", 2048)
+        if payload.get("max_tokens", limit) < limit:
+            print(f"✂️ Cut off at {payload['max_tokens']} tokens, asking again with {limit}")
+            return self.complete({**payload, "max_tokens": limit}, generation, priority)
+        if generation:
+            generation.truncated = True
+        return text
+    
+    def stream_completion(self, payload, generation, on_delta=None, priority=PRIORITY_INTERACTIVE):
+        """Stream the completion, handing batched deltas to on_delta.
+        
+        Deltas are batched on the calling thread and handed over at most once
+        per stream_refresh_ms. Returns the full text, or None if the caller
+        should fall back to a regular request.
+        """
+        refresh_interval = self.network_settings.get("stream_refresh_ms", 50) / 1000
+        parts, pending, finishes = [], [], []
+        last_flush = 0
+        
+        try:
+            response = self.client.post(self.url,
+                                        {**payload, "stream": True},
+                                        headers={**self.headers(), "Accept": "text/event-stream"},
+                                        stream=True, generation=generation, priority=priority)
+        except (GenerationCancelled, ApiError):
+            raise
+        except Exception as e:
+            print(f"⚠️ Stream request failed: {e}")
+            return None
+        
+        try:
+            if response.status_code in ApiClient.RETRY_STATUSES + (401, 403):
+                # Already retried - a regular request would fail the same way
+                raise ApiError(f"API Error {response.status_code}: {self.client.error_text(response)}")
+            if response.status_code != 200:
+                return None
+            if "text/event-stream" not in response.headers.get("content-type", ""):
+                # Server ignored "stream" and sent a normal completion
+                result = response.json()
+                text = parse_completion(result, self.completion_stats)
+                if finish_reason(result) == "length":
+                    return self.retry_truncated(payload, text, generation, priority)
+                return text
+            
+            for delta in iter_sse_deltas(self.client.iter_lines(response), self.completion_stats, finishes.append):
+                # Checked per delta - a cancel also closes the response under us
+                generation.check()
+                parts.append(delta)
+                pending.append(delta)
+                now = time.monotonic()
+                if on_delta and now - last_flush >= refresh_interval:
+                    on_delta("".join(pending))
+                    pending.clear()
+                    last_flush = now
+        except (GenerationCancelled, ApiError):
+            raise
+        except Exception as e:
+            generation.check()
+            print(f"⚠️ Stream interrupted: {e}")
+            return None
+        finally:
+            response.close()
+        
+        # Whatever is still pending is part of the returned text
+        text = "".join(parts).strip() if parts else None
+        if text and finishes[-1:] == ["length"]:
+            # The full reply replaces what was streamed once it arrives
+            return self.retry_truncated(payload, text, generation, priority)
+        return text
+    
+    def rephrase_chunks(self, text, style, generation, priority=PRIORITY_INTERACTIVE,
+                        bypass_cache=False, on_progress=None):
+        """Rephrase a long text in parallel parts and stitch it back together.
+        
+        Each part is sent with a little of its neighbours as context. The
+        separators between parts are copied from the original, and each part
+        gets its own leading/trailing whitespace and line layout back.
+        """
+        chunks = split_chunks(text, self.chunk_settings.get("chunk_chars", 800))
+        context_chars = self.chunk_settings.get("context_chars", 200)
+        print(f"✂️ Long text: {len(text)} chars in {len(chunks)} parts")
+        done = [0]
+        done_lock = threading.Lock()
+        
+        def rephrase_part(index):
+            generation.check()
+            part = chunks[index][0]
+            body = part.strip()
+            if not body:
+                return part
+            before = chunks[index - 1][0][-context_chars:] if index > 0 else ""
+            after = chunks[index + 1][0][:context_chars] if index + 1 < len(chunks) else ""
+            
+            payload = self.build_payload(body, style, (before, after))
+            key = cache_key(payload)
+            rephrased = None if bypass_cache else self.cache.get(key)
+            if rephrased is None:
+                rephrased = self.complete(payload, generation, priority)
+                if not generation.truncated:
+                    self.cache.put(key, rephrased)
+            
+            with done_lock:
+                done[0] += 1
+                if on_progress:
+                    on_progress(f"Rephrased part {done[0]} of {len(chunks)}...")
+            leading = part[:len(part) - len(part.lstrip())]
+            trailing = part[len(part.rstrip()):]
+            return leading + restore_layout(body, rephrased) + trailing
+        
+        futures = [self.chunk_pool.submit(rephrase_part, index) for index in range(len(chunks))]
+        try:
+            parts = [future.result() for future in futures]
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+        return "".join(part + separator for part, (_, separator) in zip(parts, chunks))
+    
+    def rephrase_edited(self, text, style, previous_text, previous_result, generation,
+                        priority=PRIORITY_INTERACTIVE, on_progress=None):
+        """Rephrase only the paragraphs of text that changed since previous_text.
+        
+        previous_result is what previous_text was rephrased into. Paragraphs
+        are lined up with difflib; unchanged ones keep their earlier result
+        and each run of edited or new paragraphs is sent as one request, with
+        its neighbours as context; deleting paragraphs sends nothing at all.
+        Separators come from the new text.
+        Returns None when nothing can be reused or the earlier result doesn't
+        have one paragraph per original paragraph - rephrase the whole text then.
+        """
+        old_paragraphs = split_paragraphs(previous_text)
+        old_results = split_paragraphs(previous_result)
+        new_paragraphs = split_paragraphs(text)
+        if len(old_paragraphs) != len(old_results) or len(new_paragraphs) < 2:
+            return None
+        
+        matcher = difflib.SequenceMatcher(None, [p.strip() for p, _ in old_paragraphs],
+                                          [p.strip() for p, _ in new_paragraphs], autojunk=False)
+        opcodes = matcher.get_opcodes()
+        reused = sum(j2 - j1 for tag, _, _, j1, j2 in opcodes if tag == "equal")
+        runs = [(j1, j2) for tag, _, _, j1, j2 in opcodes if tag in ("replace", "insert") and j1 < j2]
+        if not reused:
+            return None
+        
+        context_chars = self.chunk_settings.get("context_chars", 200)
+        print(f"✏️ Edited text: reusing {reused} of {len(new_paragraphs)} paragraphs, sending {len(runs)} part(s)")
+        if on_progress and runs:
+            on_progress(f"Rephrasing {len(new_paragraphs) - reused} edited paragraph(s)...")
+        
+        def rephrase_run(run):
+            generation.check()
+            j1, j2 = run
+            part = "".join(p + separator for p, separator in new_paragraphs[j1:j2 - 1]) + new_paragraphs[j2 - 1][0]
+            body = part.strip()
+            if not body:
+                return part
+            before = "".join(p + separator for p, separator in new_paragraphs[:j1])[-context_chars:]
+            after = "".join(p + separator for p, separator in new_paragraphs[j2:])[:context_chars]
+            
+            payload = self.build_payload(body, style, (before.strip(), after.strip()))
+            key = cache_key(payload)
+            rephrased = self.cache.get(key)
+            if rephrased is None:
+                rephrased = self.complete(payload, generation, priority)
+                if not generation.truncated:
+                    self.cache.put(key, rephrased)
+            leading = part[:len(part) - len(part.lstrip())]
+            trailing = part[len(part.rstrip()):]
+            return leading + restore_layout(body, rephrased) + trailing
+        
+        futures = {run: self.chunk_pool.submit(rephrase_run, run) for run in runs}
+        try:
+            results = {run: future.result() for run, future in futures.items()}
+        except Exception:
+            for future in futures.values():
+                future.cancel()
+            raise
+        
+        pieces = []
+        tokens_saved = 0
+        for tag, i1, i2, j1, j2 in opcodes:
+            if tag == "equal":
+                for i, j in zip(range(i1, i2), range(j1, j2)):
+                    part, separator = new_paragraphs[j]
+                    leading = part[:len(part) - len(part.lstrip())]
+                    trailing = part[len(part.rstrip()):]
+                    pieces.append(leading + old_results[i][0].strip() + trailing + separator)
+                    tokens_saved += approx_tokens(old_paragraphs[i][0]) + approx_tokens(old_results[i][0])
+            elif j1 < j2:
+                pieces.append(results[(j1, j2)] + new_paragraphs[j2 - 1][1])
+        self.edit_stats.record(reused, len(new_paragraphs) - reused, tokens_saved)
+        return "".join(pieces)
+    
+    def segment_key(self, body, style):
+        """Cache key of one rephrased sentence - the same in any text"""
+        system, _ = split_prompt(self.styles[style])
+        return cache_key({"segment": body, "model": self.model, "system": system})
+    
+    def rephrase_segments(self, text, style, generation, priority=PRIORITY_INTERACTIVE, bypass_cache=False):
+        """Rephrase text sentence by sentence, filling known sentences from the cache.
+        
+        Sentences (and lines) this style has rephrased before are taken from
+        the cache; the rest go to the model as numbered lines in one request
+        and are cached one by one. Bullets, indentation and separators are
+        kept from the original. Returns None for texts with fewer than
+        min_segments sentences, long texts (those are chunked) and replies
+        that don't have exactly one line per number - rephrase the whole text then.
+        """
+        if self.chunk_settings.get("enabled", True) and len(text) >= self.chunk_settings.get("min_chars", 1500):
+            return None
+        segments = []  # (prefix, body, trailing, separator)
+        for segment, separator in split_segments(text):
+            prefix = LINE_PREFIX.match(segment).group(0)
+            body = segment[len(prefix):].strip()
+            segments.append((prefix, body, segment[len(segment.rstrip()):] if body else "", separator))
+        bodies = [body for _, body, _, _ in segments if body]
+        if len(bodies) < self.segment_settings.get("min_segments", 2):
+            return None
+        
+        known = {}
+        if not bypass_cache:
+            for body in set(bodies):
+                cached = self.cache.get(self.segment_key(body, style))
+                if cached is not None:
+                    known[body] = cached
+        novel = list(dict.fromkeys(body for body in bodies if body not in known))
+        
+        if novel:
+            generation.check()
+            numbered = "\n".join(f"[{number}] {body}" for number, body in enumerate(novel, 1))
+            payload = self.build_payload(numbered, style)
+            payload["messages"][-1]["content"] = SEGMENT_INSTRUCTIONS + "\n\n" + payload["messages"][-1]["content"]
+            reply = self.complete(payload, generation, priority)
+            if generation.truncated:
+                generation.truncated = False  # The whole text gets its own try
+                self.segment_stats.fallback()
+                return None
+            lines = dict(re.findall(r"^\s*\[(\d+)\]\s*(.*?)\s*$", reply, re.MULTILINE))
+            if sorted(lines) != sorted(str(number) for number in range(1, len(novel) + 1)) or not all(lines.values()):
+                print("⚠️ Sentence reply didn't keep the numbering, rephrasing the whole text")
+                self.segment_stats.fallback()
+                return None
+            for number, body in enumerate(novel, 1):
+                known[body] = lines[str(number)]
+                self.cache.put(self.segment_key(body, style), known[body])
+        
+        hits = sum(1 for body in bodies if body not in novel)
+        tokens_saved = sum(approx_tokens(body) + approx_tokens(known[body]) for body in bodies if body not in novel)
+        if not novel:
+            tokens_saved += approx_tokens(split_prompt(self.styles[style])[0])  # No request at all
+        self.segment_stats.record(len(bodies), hits, tokens_saved, 1 if novel else 0)
+        print(f"🧩 Sentences: {hits} of {len(bodies)} from cache, {len(novel)} sent")
+        return "".join(prefix + known[body] + trailing + separator if body else prefix + separator
+                       for prefix, body, trailing, separator in segments)
+    
+    def close(self):
+        if self._runner:
+            self._runner.close()
+        self.chunk_pool.shutdown(wait=False)
+        self.client.close()
+        self.cache.close()
+
+def prompt_report(engine, live=False):
+    """Print prompt tokens per style: old single-message layout vs the
+    system-prefix layout. With live=True both layouts are also sent to
+    Fireworks and the measured latency and reported usage are printed."""
+    samples = {
+        "short": "Doing good, what about you my friend?",
+        "long": ("So for those that staked are we getting 140% bonus or is that only for the new pool? "
+                 "I checked the docs but it says different things in two places and the dashboard "
+                 "shows something else. Can someone confirm before the snapshot tomorrow")
+    }
+    
+    def send(payload):
+        started = time.monotonic()
+        response = engine.client.post(engine.url, payload, headers=engine.headers())
+        elapsed = (time.monotonic() - started) * 1000
+        if response.status_code != 200:
+            return f"HTTP {response.status_code}"
+        usage = response.json().get("usage") or {}
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", "?")
+        return f"{elapsed:6.0f} ms, {usage.get('prompt_tokens', '?')} prompt / {cached} cached"
+    
+    print("Approximate prompt tokens (~4 chars per token)")
+    print(f"{'Style':<14}{'Input':<7}{'Before':>8}{'After':>8}{'Uncached':>10}")
+    for style in engine.styles:
+        for label, text in samples.items():
+            system, template = split_prompt(engine.styles[style])
+            before = [{"role": "user", "content": f"{system}\n\n{template.format(input_text=text)}"}]
+            after = engine.style_messages(text, style)
+            print(f"{style:<14}{label:<7}"
+                  f"{sum(approx_tokens(m['content']) for m in before):>8}"
+                  f"{sum(approx_tokens(m['content']) for m in after):>8}"
+                  f"{approx_tokens(after[-1]['content']):>10}")
+            
+            if live:
+                payload = engine.build_payload(text, style)
+                print(f"    before: {send({**payload, 'messages': before})}")
+                print(f"    after:  {send(payload)}")
+                print(f"    again:  {send(payload)}")
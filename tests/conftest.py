@@ -0,0 +1,146 @@
+"""
+Shared fixtures: local stand-ins for the Fireworks endpoint.
+
+mock_url is `python -m dobby mock` (echoes "Rephrased: <input>"). stand_in
+serves scripted replies - errors, slow streams, JSON to a stream request -
+and records every request body it gets.
+"""
+import os
+import sys
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rephrase_engine import RephraseEngine
+from dobby import MockFireworksServer
+
+API_KEY = "test-key-0123456789"
+
+class Reply:
+    """One scripted response: JSON content, an SSE stream of deltas, or an error"""
+    def __init__(self, status=200, content=None, deltas=None, delay=0, body_delay=0, delta_delay=0, headers=None,
+                 finish_reason="stop"):
+        self.status = status
+        self.content = content
+        self.deltas = deltas
+        self.delay = delay  # Before the headers
+        self.body_delay = body_delay  # Between the headers and the body
+        self.delta_delay = delta_delay
+        self.headers = headers or {}
+        self.finish_reason = finish_reason
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        reply = self.server.next_reply(payload)
+        time.sleep(reply.delay)
+        
+        if reply.deltas is None:
+            if reply.status == 200:
+                content = reply.content if reply.content is not None else "ok"
+                body = {"choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                     "finish_reason": reply.finish_reason}]}
+            else:
+                body = {"error": {"message": f"scripted {reply.status}"}}
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(reply.status)
+            for name, value in reply.headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.flush()
+            time.sleep(reply.body_delay)
+            try:
+                self.wfile.write(data)
+            except OSError:
+                self.server.aborted += 1
+            return
+        
+        self.send_response(reply.status)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            for delta in reply.deltas:
+                chunk = {"choices": [{"delta": {"content": delta}, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(reply.delta_delay)
+            done = {"choices": [{"delta": {}, "finish_reason": reply.finish_reason}]}
+            self.wfile.write(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        except OSError:
+            self.server.aborted += 1  # The client hung up mid-stream
+
+class StandInServer(ThreadingHTTPServer):
+    """Answers with the scripted replies in order; the last one repeats"""
+    daemon_threads = True
+    
+    def __init__(self, replies):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.replies = list(replies)
+        self.requests = []
+        self.aborted = 0
+        self._lock = threading.Lock()
+    
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1/chat/completions"
+    
+    def next_reply(self, payload):
+        with self._lock:
+            self.requests.append(payload)
+            return self.replies.pop(0) if len(self.replies) > 1 else self.replies[0]
+
+def serve(server):
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    return server
+
+@pytest.fixture
+def stand_in():
+    """stand_in(Reply(...), ...) starts a scripted server"""
+    servers = []
+    
+    def start(*replies):
+        servers.append(serve(StandInServer(replies)))
+        return servers[-1]
+    
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+@pytest.fixture
+def mock_url():
+    server = serve(MockFireworksServer(("127.0.0.1", 0), 0.05))
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def make_engine():
+    """make_engine(url, network={...}, ...) - memory-only cache, quick retries"""
+    engines = []
+    
+    def make(url, network=None, **options):
+        network_settings = {"retries": 2, "backoff_base": 0.01, "backoff_max": 0.05, "stream_refresh_ms": 0,
+                            "timeout": 5, **(network or {})}
+        options.setdefault("cache_settings", {"path": ""})
+        engines.append(RephraseEngine(api_key=API_KEY, url=url, network_settings=network_settings, **options))
+        return engines[-1]
+    
+    yield make
+    for engine in engines:
+        engine.close()
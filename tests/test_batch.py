@@ -0,0 +1,71 @@
+"""python -m dobby batch: results appended as JSONL, finished items journaled so reruns skip them"""
+import json
+
+import pytest
+
+import dobby
+
+from conftest import API_KEY, Reply
+
+@pytest.fixture
+def inputs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # The response cache file goes here
+    records = tmp_path / "tickets.jsonl"
+    records.write_text("\n".join([
+        json.dumps({"id": "a", "body": {"text": "First ticket"}}),
+        "not json",
+        json.dumps({"id": "b", "body": {"text": "Second ticket"}}),
+        json.dumps({"id": "c", "body": {"text": ""}}),
+        "",
+    ]), encoding="utf-8")
+    macros = tmp_path / "macros"
+    (macros / "nested").mkdir(parents=True)
+    (macros / "hello.txt").write_text("Hello there", encoding="utf-8")
+    (macros / "nested" / "bye.md").write_text("Bye for now", encoding="utf-8")
+    (macros / "notes.log").write_text("Not a text file", encoding="utf-8")
+    return [str(records), str(macros)]
+
+def run(inputs, server, output, *extra):
+    return dobby.main(["batch", *inputs, "--style", "friendly", "--field", "body.text", "-o", str(output),
+                       "--upstream", server.url, "--api-key", API_KEY, *extra])
+
+def read_output(output):
+    return [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+
+def test_rerun_skips_finished_items(stand_in, inputs, tmp_path):
+    server = stand_in(Reply(content="Rephrased"))
+    output = tmp_path / "out.jsonl"
+    
+    assert run(inputs, server, output) == 0
+    records = read_output(output)
+    assert len(server.requests) == 4
+    assert sorted(record["input"] for record in records) == ["Bye for now", "First ticket", "Hello there", "Second ticket"]
+    assert all(record["output"] == "Rephrased" and record["style"] == "friendly" for record in records)
+    assert len((tmp_path / "out.jsonl.journal").read_text().splitlines()) == 4
+    
+    assert run(inputs, server, output) == 0
+    assert len(server.requests) == 4
+    assert read_output(output) == records
+
+def test_failed_items_are_retried_on_the_next_run(stand_in, inputs, tmp_path):
+    server = stand_in(Reply(status=400), Reply(content="Rephrased"))
+    output = tmp_path / "out.jsonl"
+    journal = tmp_path / "progress.journal"
+    
+    assert run(inputs, server, output, "-c", "1", "--journal", str(journal)) == 1
+    assert len(read_output(output)) == 3
+    assert len(journal.read_text().splitlines()) == 3
+    texts = {"Bye for now", "First ticket", "Hello there", "Second ticket"}
+    (failed,) = texts - {record["input"] for record in read_output(output)}
+    
+    assert run(inputs, server, output, "-c", "1", "--journal", str(journal)) == 0
+    assert len(server.requests) == 5  # Only the failed item again
+    assert failed in server.requests[-1]["messages"][-1]["content"]
+    assert sorted(record["input"] for record in read_output(output)) == sorted(texts)
+    assert len(set(journal.read_text().splitlines())) == 4
+
+def test_unknown_style_sends_nothing(stand_in, inputs, tmp_path):
+    server = stand_in(Reply(content="Rephrased"))
+    assert dobby.main(["batch", *inputs, "--style", "no such style", "-o", str(tmp_path / "out.jsonl"),
+                       "--upstream", server.url, "--api-key", API_KEY]) == 2
+    assert server.requests == []
@@ -0,0 +1,77 @@
+"""ResponseCache: memory LRU in front of SQLite, with expiry and a size limit"""
+import sqlite3
+import time
+
+from rephrase_engine import ResponseCache
+
+def counters(cache):
+    return cache.memory_hits, cache.disk_hits, cache.misses
+
+def stored_keys(path):
+    with sqlite3.connect(path) as db:
+        return sorted(key for key, in db.execute("SELECT key FROM responses"))
+
+def test_evicted_entries_come_back_from_disk(tmp_path):
+    cache = ResponseCache(path=str(tmp_path / "cache.db"), memory_items=1)
+    cache.put("a", "first")
+    cache.put("b", "second")  # Pushes "a" out of memory
+    
+    assert cache.get("a") == "first"
+    assert cache.get("a") == "first"
+    assert cache.get("missing") is None
+    assert counters(cache) == (1, 1, 1)  # From disk once, then from memory again
+    cache.close()
+
+def test_entries_survive_a_restart(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResponseCache(path=path)
+    cache.put("a", "first")
+    cache.close()
+    
+    cache = ResponseCache(path=path)
+    assert cache.get("a") == "first"
+    assert counters(cache) == (0, 1, 0)
+    cache.close()
+
+def test_least_recently_used_entries_are_trimmed(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResponseCache(path=path, memory_items=1, max_entries=2)
+    cache.put("a", "first")
+    cache.put("b", "second")
+    assert cache.get("a") == "first"  # From disk - "a" is now used more recently than "b"
+    cache.put("c", "third")
+    assert stored_keys(path) == ["a", "c"]
+    cache.close()
+    
+    cache = ResponseCache(path=path, memory_items=1, max_entries=2)
+    assert cache.get("a") == "first"
+    assert cache.get("b") is None
+    assert cache.get("c") == "third"
+    assert counters(cache) == (0, 2, 1)
+    cache.close()
+
+def test_entries_expire(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResponseCache(path=path, memory_items=1, max_entries=2, ttl_days=0.3 / 86400)
+    cache.put("a", "first")
+    assert cache.get("a") == "first"
+    time.sleep(0.4)
+    
+    assert cache.get("a") is None  # Neither memory nor disk hands out an expired entry
+    assert counters(cache) == (1, 0, 1)
+    cache.put("b", "second")  # Writing also deletes expired rows
+    assert stored_keys(path) == ["b"]
+    cache.close()
+
+def test_disabled_and_memory_only(tmp_path):
+    disabled = ResponseCache(path=str(tmp_path / "off.db"), enabled=False)
+    disabled.put("a", "first")
+    assert disabled.get("a") is None
+    assert not (tmp_path / "off.db").exists()
+    
+    memory = ResponseCache(path="", memory_items=1)
+    memory.put("a", "first")
+    memory.put("b", "second")
+    assert memory.get("a") is None
+    assert memory.get("b") == "second"
+    assert counters(memory) == (1, 0, 1)
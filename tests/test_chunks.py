@@ -0,0 +1,73 @@
+"""Long texts: splitting into parts and putting them back together exactly"""
+import re
+
+import pytest
+
+from rephrase_engine import split_chunks, split_paragraphs, restore_layout
+
+LONG_TEXT = "\n".join([
+    "Hi team,",
+    "",
+    "Quick update on the release. " * 20,
+    "",
+    "  - First bullet with some detail.",
+    "  - Second bullet, indented the same way.",
+    "",
+    "",
+    "1. Numbered step one.",
+    "2) Numbered step two!",
+    "\t\tTabbed line? Yes. " * 30,
+    "",
+    "Thanks,\r",
+    "Alex   ",
+])
+
+@pytest.mark.parametrize("max_chars", [40, 200, 800, 5000])
+def test_split_chunks_round_trips_exactly(max_chars):
+    chunks = split_chunks(LONG_TEXT, max_chars)
+    assert "".join(part + separator for part, separator in chunks) == LONG_TEXT
+
+def test_split_chunks_respects_size_where_it_can():
+    chunks = split_chunks(LONG_TEXT, 200)
+    assert len(chunks) > 3
+    # Only a single sentence longer than the limit may exceed it
+    for part, _ in chunks:
+        assert len(part) <= 200 or len(re.split(r"(?<=[.!?])[ \t]+", part)) == 1
+
+def test_split_chunks_breaks_at_paragraphs_first():
+    text = "First paragraph.\n\nSecond paragraph."
+    assert split_chunks(text, 20) == [("First paragraph.", "\n\n"), ("Second paragraph.", "")]
+
+def test_split_paragraphs_round_trips_exactly():
+    paragraphs = split_paragraphs(LONG_TEXT)
+    assert "".join(part + separator for part, separator in paragraphs) == LONG_TEXT
+    assert all(separator.count("\n") >= 2 for _, separator in paragraphs[:-1])
+
+def test_restore_layout_keeps_bullets_indentation_and_blank_lines():
+    original = "Intro line\n\n  - first item\n  - second item\n\n\t3. third step  "
+    rephrased = "Opening line\n\n- item one\n* item two\n\n3) step three"
+    assert restore_layout(original, rephrased) == ("Opening line\n\n  - item one\n  - item two\n\n"
+                                                   "\t3. step three  ")
+
+def test_restore_layout_leaves_different_structure_alone():
+    original = "One\nTwo\nThree"
+    rephrased = "One and two\nThree"
+    assert restore_layout(original, rephrased) == rephrased
+    assert restore_layout("One\n\nTwo", "One\nX\nTwo") == "One\nX\nTwo"  # Blank line moved
+
+def test_long_text_is_rephrased_in_parts_and_reassembled(mock_url, make_engine):
+    engine = make_engine(mock_url, chunk_settings={"enabled": True, "min_chars": 300, "chunk_chars": 200,
+                                                   "context_chars": 50, "max_workers": 4})
+    progress = []
+    result = engine.rephrase(LONG_TEXT, "friendly", on_progress=progress.append)
+    
+    chunks = split_chunks(LONG_TEXT, 200)
+    assert len(progress) == len(chunks)
+    # The mock answers "Rephrased: <part>" - separators and outer whitespace come from the original
+    expected = []
+    for part, separator in chunks:
+        body = part.strip()
+        leading = part[:len(part) - len(part.lstrip())]
+        trailing = part[len(part.rstrip()):]
+        expected.append(leading + restore_layout(body, f"Rephrased: {body}") + trailing + separator)
+    assert result == "".join(expected)
@@ -0,0 +1,68 @@
+"""Edited texts: only changed paragraphs are sent again, the rest keep their earlier result"""
+from conftest import Reply
+
+PREVIOUS = ("A one.\n\nB two.\n\nC three.", "X1\n\nX2\n\nX3")
+
+def user_text(request):
+    return request["messages"][-1]["content"]
+
+def test_edited_paragraph_is_the_only_one_sent(stand_in, make_engine):
+    server = stand_in(Reply(content="Y2"))
+    engine = make_engine(server.url, network={"stream": False})
+    
+    result = engine.rephrase("A one.\n\n  B two, changed.\n\n\nC three.", "friendly", previous=PREVIOUS)
+    assert result == "X1\n\n  Y2\n\n\nX3"
+    assert len(server.requests) == 1
+    sent = user_text(server.requests[0])
+    assert "B two, changed." in sent
+    assert "BEFORE: ...A one." in sent and "AFTER: C three...." in sent
+    stats = engine.edit_stats
+    assert (stats.edits, stats.reused, stats.sent) == (1, 2, 1)
+
+def test_result_with_other_paragraphs_rephrases_the_whole_text(stand_in, make_engine):
+    server = stand_in(Reply(content="Whole text."))
+    engine = make_engine(server.url, network={"stream": False})
+    text = "A one.\n\nB two, changed.\n\nC three."
+    
+    assert engine.rephrase_edited(text, "friendly", PREVIOUS[0], "X1 X2 X3", None) is None
+    assert engine.rephrase(text, "friendly", previous=(PREVIOUS[0], "X1 X2 X3")) == "Whole text."
+    assert len(server.requests) == 1
+    assert "CONTEXT" not in user_text(server.requests[0])
+    assert engine.edit_stats.edits == 0
+
+def test_inserted_paragraph_is_sent_alone(stand_in, make_engine):
+    server = stand_in(Reply(content="N"))
+    engine = make_engine(server.url, network={"stream": False})
+    
+    assert engine.rephrase("A one.\n\nNew bit.\n\nB two.\n\nC three.", "friendly", previous=PREVIOUS) == "X1\n\nN\n\nX2\n\nX3"
+    assert len(server.requests) == 1
+    assert "New bit." in user_text(server.requests[0])
+
+def test_deleted_paragraph_sends_nothing(stand_in, make_engine):
+    server = stand_in(Reply(content="unused"))
+    engine = make_engine(server.url, network={"stream": False})
+    
+    assert engine.rephrase("A one.\n\nC three.", "friendly", previous=PREVIOUS) == "X1\n\nX3"
+    assert server.requests == []
+
+def test_edit_next_to_a_deletion(stand_in, make_engine):
+    server = stand_in(Reply(content="Y1"))
+    engine = make_engine(server.url, network={"stream": False})
+    
+    assert engine.rephrase("A one, changed.\n\nC three.", "friendly", previous=PREVIOUS) == "Y1\n\nX3"
+    assert len(server.requests) == 1
+
+def test_every_paragraph_changed_rephrases_the_whole_text(stand_in, make_engine):
+    server = stand_in(Reply(content="Whole text."))
+    engine = make_engine(server.url, network={"stream": False})
+    
+    assert engine.rephrase("D.\n\nE.", "friendly", previous=PREVIOUS) == "Whole text."
+    assert len(server.requests) == 1
+    assert "CONTEXT" not in user_text(server.requests[0])
+
+def test_bypass_cache_ignores_the_earlier_result(stand_in, make_engine):
+    server = stand_in(Reply(content="Fresh."))
+    engine = make_engine(server.url, network={"stream": False})
+    
+    assert engine.rephrase(PREVIOUS[0], "friendly", previous=PREVIOUS, bypass_cache=True) == "Fresh."
+    assert len(server.requests) == 1
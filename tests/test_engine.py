@@ -0,0 +1,199 @@
+"""RephraseEngine end to end: sync, async and submit() against stand-in endpoints"""
+import time
+import asyncio
+import threading
+from concurrent.futures import CancelledError
+
+import pytest
+
+from rephrase_engine import (RephraseEngine, EngineLoop, Generation, GenerationCancelled, ApiError, cache_key, split_chunks,
+                             PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND, PRIORITY_BATCH)
+
+from conftest import Reply
+
+def test_rephrase_against_mock(mock_url, make_engine):
+    engine = make_engine(mock_url, network={"stream": False})
+    assert engine.rephrase("hello how are you", "friendly") == "Rephrased: hello how are you"
+
+def test_arephrase_against_mock(mock_url, make_engine):
+    engine = make_engine(mock_url)
+    
+    async def main():
+        return await asyncio.gather(*(engine.arephrase(f"text {n}", "friendly") for n in range(5)))
+    
+    assert asyncio.run(main()) == [f"Rephrased: text {n}" for n in range(5)]
+
+def test_submit_returns_futures(mock_url, make_engine):
+    engine = make_engine(mock_url)
+    futures = [engine.submit(f"text {n}", "friendly") for n in range(10)]
+    assert [future.result(timeout=5) for future in futures] == [f"Rephrased: text {n}" for n in range(10)]
+    assert engine.runner.done == 10
+
+def test_repeated_text_comes_from_cache(stand_in, make_engine):
+    server = stand_in(Reply(deltas=["Cached ", "reply"]))
+    engine = make_engine(server.url)
+    assert engine.rephrase("hey", "friendly") == "Cached reply"
+    
+    generation = Generation()
+    assert engine.rephrase("hey", "friendly", generation=generation) == "Cached reply"
+    assert generation.from_cache
+    assert len(server.requests) == 1
+    
+    engine.rephrase("hey", "friendly", bypass_cache=True)  # "Again"
+    assert len(server.requests) == 2
+
+def test_long_texts_are_chunked_and_cached(mock_url, make_engine):
+    engine = make_engine(mock_url, chunk_settings={"min_chars": 200, "chunk_chars": 100})
+    text = "\n\n".join(f"Paragraph number {n} has a few words in it." for n in range(8))
+    result = engine.rephrase(text, "friendly")
+    assert result.count("Rephrased: ") == len(split_chunks(text, 100)) > 1
+    
+    generation = Generation()
+    assert engine.rephrase(text, "friendly", generation=generation) == result
+    assert generation.from_cache
+
+def test_identical_requests_share_one_call(stand_in, make_engine):
+    server = stand_in(Reply(content="Shared", delay=0.3))
+    engine = make_engine(server.url, network={"stream": False})
+    futures = [engine.submit("same text", "friendly") for _ in range(4)]
+    assert [future.result(timeout=5) for future in futures] == ["Shared"] * 4
+    assert len(server.requests) == 1
+    assert engine.flights.saved == 3
+
+def test_waiters_take_over_when_the_leader_is_cancelled(stand_in, make_engine):
+    server = stand_in(Reply(content="Slow", body_delay=0.5))
+    engine = make_engine(server.url, network={"stream": False})
+    leader = Generation()
+    first = engine.submit("same text", "friendly", generation=leader)
+    time.sleep(0.1)
+    second = engine.submit("same text", "friendly")
+    time.sleep(0.1)
+    leader.cancel()
+    
+    with pytest.raises(GenerationCancelled):
+        first.result(timeout=5)
+    assert second.result(timeout=5) == "Slow"
+    assert len(server.requests) == 2
+
+def test_cancelling_the_future_stops_the_stream(stand_in, make_engine):
+    server = stand_in(Reply(deltas=["one ", "two ", "three"], delta_delay=1))
+    engine = make_engine(server.url)
+    received = []
+    future = engine.submit("hey", "friendly", on_delta=received.append)
+    time.sleep(0.3)
+    started = time.monotonic()
+    future.cancel()
+    with pytest.raises(CancelledError):
+        future.result(timeout=5)
+    # The stream is cut: the handler notices the closed connection on its next write
+    deadline = time.monotonic() + 3
+    while not server.aborted and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert server.aborted == 1
+    assert time.monotonic() - started < 3
+    assert engine.cache.get(cache_key(engine.build_payload("hey", "friendly"))) is None
+
+def test_cancelled_generation_before_start_sends_nothing(stand_in, make_engine):
+    server = stand_in(Reply(content="never"))
+    engine = make_engine(server.url)
+    generation = Generation()
+    generation.cancel()
+    with pytest.raises(GenerationCancelled):
+        engine.submit("hey", "friendly", generation=generation).result(timeout=5)
+    assert server.requests == []
+
+def test_submit_limits_concurrency(stand_in, make_engine):
+    server = stand_in(Reply(content="ok", delay=0.2))
+    engine = make_engine(server.url, network={"stream": False, "max_concurrent": 2})
+    futures = [engine.submit(f"text {n}", "friendly") for n in range(6)]
+    for future in futures:
+        future.result(timeout=5)
+    assert engine.runner.peak == 2
+
+def test_interactive_calls_go_first():
+    runner = EngineLoop(max_concurrent=1)
+    release = threading.Event()
+    order = []
+    
+    async def hold():
+        await asyncio.get_running_loop().run_in_executor(None, release.wait)
+    
+    async def record(name):
+        order.append(name)
+    
+    try:
+        held = runner.submit(hold)
+        futures = [runner.submit(record, "batch", priority=PRIORITY_BATCH),
+                   runner.submit(record, "background", priority=PRIORITY_BACKGROUND),
+                   runner.submit(record, "interactive", priority=PRIORITY_INTERACTIVE)]
+        while runner.waiting < 3:
+            time.sleep(0.01)
+        release.set()
+        held.result(timeout=5)
+        for future in futures:
+            future.result(timeout=5)
+    finally:
+        release.set()
+        runner.close()
+    assert order == ["interactive", "background", "batch"]
+
+def test_batch_work_uses_every_slot(stand_in, make_engine):
+    server = stand_in(Reply(content="ok", delay=0.2))
+    engine = make_engine(server.url, network={"stream": False, "max_concurrent": 3})
+    futures = [engine.submit(f"text {n}", "friendly", priority=PRIORITY_BATCH) for n in range(6)]
+    for future in futures:
+        future.result(timeout=5)
+    assert engine.runner.peak == 3
+
+def test_background_work_leaves_a_slot_for_interactive():
+    runner = EngineLoop(max_concurrent=2, reserved_interactive=1)
+    release = threading.Event()
+    
+    async def hold():
+        await asyncio.get_running_loop().run_in_executor(None, release.wait)
+    
+    async def quick():
+        return "done"
+    
+    try:
+        held = [runner.submit(hold, priority=PRIORITY_BACKGROUND) for _ in range(2)]
+        while runner.running < 1 or runner.waiting < 1:
+            time.sleep(0.01)
+        assert runner.submit(quick).result(timeout=1) == "done"
+        assert runner.running == 1
+        
+        queued = runner.submit(quick, priority=PRIORITY_BACKGROUND)
+        queued.cancel()
+        release.set()
+        for future in held:
+            future.result(timeout=5)
+        with pytest.raises(CancelledError):
+            queued.result(timeout=1)
+    finally:
+        release.set()
+        runner.close()
+    assert runner.peak == 2
+
+def test_errors_are_raised(stand_in, make_engine):
+    server = stand_in(Reply(status=401))
+    engine = make_engine(server.url, network={"stream": False})
+    with pytest.raises(ApiError):
+        engine.rephrase("hey", "friendly")
+    with pytest.raises(ApiError):
+        engine.rephrase("hey", "no such style")
+    with pytest.raises(ApiError):
+        RephraseEngine(api_key="", url=server.url, cache_settings={"path": ""}).rephrase("hey", "friendly")
+
+def test_streaming_results_are_delivered_in_order_from_threads(mock_url, make_engine):
+    engine = make_engine(mock_url)
+    results = {}
+    
+    def worker(n):
+        results[n] = engine.rephrase(f"thread {n}", "friendly")
+    
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {n: f"Rephrased: thread {n}" for n in range(8)}
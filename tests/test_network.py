@@ -0,0 +1,108 @@
+"""ApiClient: cancelling transfers, retries and the circuit breaker"""
+import time
+import threading
+
+import pytest
+
+from rephrase_engine import ApiClient, ApiError, Generation, GenerationCancelled
+
+from conftest import Reply
+
+PAYLOAD = {"model": "test", "messages": [{"role": "user", "content": "hi"}], "max_tokens": 16}
+
+def cancel_after(generation, seconds):
+    timer = threading.Timer(seconds, generation.cancel)
+    timer.start()
+    return timer
+
+def test_cancel_aborts_regular_response_body(stand_in):
+    server = stand_in(Reply(content="slow body", body_delay=2))
+    client = ApiClient(retries=0)
+    generation = Generation()
+    cancel_after(generation, 0.2)
+    started = time.monotonic()
+    with pytest.raises(GenerationCancelled):
+        client.post(server.url, PAYLOAD, generation=generation)
+    assert time.monotonic() - started < 1
+    assert client.breaker(server.url).failures == 0  # A cancel says nothing about the endpoint
+    client.close()
+
+def test_cancel_aborts_stream(stand_in, make_engine):
+    server = stand_in(Reply(deltas=["first ", "second ", "third"], delta_delay=2))
+    engine = make_engine(server.url)
+    generation = Generation()
+    cancel_after(generation, 0.3)
+    started = time.monotonic()
+    with pytest.raises(GenerationCancelled):
+        engine.rephrase("hey", "friendly", generation=generation)
+    assert time.monotonic() - started < 1
+
+def test_retries_server_errors_then_succeeds(stand_in):
+    server = stand_in(Reply(status=500), Reply(status=503), Reply(content="finally"))
+    client = ApiClient(retries=3, backoff_base=0.01, backoff_max=0.02)
+    response = client.post(server.url, PAYLOAD)
+    assert response.status_code == 200
+    assert response.json()["choices"][0]["message"]["content"] == "finally"
+    assert (client.requests_sent, client.retries_done) == (3, 2)
+    client.close()
+
+def test_honours_retry_after(stand_in):
+    server = stand_in(Reply(status=429, headers={"Retry-After": "0.3"}), Reply(content="ok"))
+    client = ApiClient(retries=1, backoff_base=0.01, backoff_max=0.02)
+    started = time.monotonic()
+    assert client.post(server.url, PAYLOAD).status_code == 200
+    assert time.monotonic() - started >= 0.3
+    assert client.breaker(server.url).failures == 0  # 429 means busy, not broken
+    client.close()
+
+def test_gives_up_with_the_last_error_response(stand_in):
+    server = stand_in(Reply(status=502))
+    client = ApiClient(retries=2, backoff_base=0.01, backoff_max=0.02)
+    assert client.post(server.url, PAYLOAD).status_code == 502
+    assert len(server.requests) == 3
+    client.close()
+
+def test_circuit_opens_fails_fast_and_recovers(stand_in):
+    server = stand_in(Reply(status=500), Reply(status=500), Reply(content="back"))
+    client = ApiClient(retries=0, breaker_threshold=2, breaker_cooldown=0.3)
+    for _ in range(2):
+        assert client.post(server.url, PAYLOAD).status_code == 500
+    with pytest.raises(ApiError):
+        client.post(server.url, PAYLOAD)  # Open - nothing is sent
+    assert len(server.requests) == 2
+    assert client.breaker(server.url).trips == 1
+    
+    time.sleep(0.35)
+    assert client.post(server.url, PAYLOAD).status_code == 200  # The probe closes it again
+    assert client.post(server.url, PAYLOAD).status_code == 200
+    client.close()
+
+def test_cancelled_probe_lets_the_next_request_probe(stand_in):
+    server = stand_in(Reply(status=500), Reply(content="slow", body_delay=2), Reply(content="back"))
+    client = ApiClient(retries=0, breaker_threshold=1, breaker_cooldown=0.1)
+    assert client.post(server.url, PAYLOAD).status_code == 500
+    time.sleep(0.15)
+    
+    generation = Generation()
+    cancel_after(generation, 0.2)
+    with pytest.raises(GenerationCancelled):
+        client.post(server.url, PAYLOAD, generation=generation)  # The probe
+    assert client.post(server.url, PAYLOAD).status_code == 200
+    client.close()
+
+def test_probe_slot_is_not_held_while_waiting_for_rate_budget(stand_in):
+    server = stand_in(Reply(status=500), Reply(content="back"))
+    client = ApiClient(retries=0, breaker_threshold=1, breaker_cooldown=0.1, requests_per_minute=1)
+    assert client.post(server.url, PAYLOAD).status_code == 500  # Opens the circuit, uses the budget
+    time.sleep(0.15)
+    
+    generation = Generation()
+    waiting = threading.Thread(target=lambda: pytest.raises(GenerationCancelled, client.post, server.url,
+                                                              PAYLOAD, generation=generation))
+    waiting.start()
+    time.sleep(0.2)
+    assert client.scheduler.queue_depth() == 1
+    assert client.breaker(server.url).allow()  # The queued request hasn't taken the probe
+    generation.cancel()
+    waiting.join()
+    client.close()
@@ -0,0 +1,32 @@
+"""Replies cut off by max_tokens are retried with the full budget and never cached"""
+from rephrase_engine import Generation
+
+from conftest import Reply
+
+def test_cut_off_reply_is_asked_again_with_full_budget(stand_in, make_engine):
+    server = stand_in(Reply(content="Half a sen", finish_reason="length"), Reply(content="Half a sentence, whole."))
+    engine = make_engine(server.url, network={"stream": False}, api_settings={"max_tokens": 2048})
+    generation = Generation()
+    assert engine.rephrase("hey there", "friendly", generation=generation) == "Half a sentence, whole."
+    assert server.requests[0]["max_tokens"] < 2048
+    assert server.requests[1]["max_tokens"] == 2048
+    assert not generation.truncated
+
+def test_cut_off_stream_is_asked_again_with_full_budget(stand_in, make_engine):
+    server = stand_in(Reply(deltas=["Half ", "a"], finish_reason="length"), Reply(content="Whole reply."))
+    engine = make_engine(server.url, api_settings={"max_tokens": 2048})
+    assert engine.rephrase("hey there", "friendly") == "Whole reply."
+    assert server.requests[1]["max_tokens"] == 2048
+
+def test_cut_off_at_full_budget_is_marked_and_not_cached(stand_in, make_engine):
+    server = stand_in(Reply(content="Still cut", finish_reason="length"))
+    engine = make_engine(server.url, network={"stream": False}, api_settings={"max_tokens": 64})
+    generation = Generation()
+    assert engine.rephrase("hey there", "friendly", generation=generation) == "Still cut"
+    assert generation.truncated
+    assert len(server.requests) == 1  # Already at the configured maximum
+    
+    generation = Generation()
+    engine.rephrase("hey there", "friendly", generation=generation)
+    assert not generation.from_cache
+    assert len(server.requests) == 2
@@ -0,0 +1,27 @@
+"""python -m dobby prompt-report: prompt tokens per style, and measured latency with --live"""
+import dobby
+from rephrase_engine import WRITING_STYLES
+
+from conftest import API_KEY, Reply
+
+def test_report_lists_every_style_without_sending(stand_in, capsys):
+    server = stand_in(Reply(content="unused"))
+    assert dobby.main(["prompt-report", "--upstream", server.url, "--api-key", ""]) == 0
+    
+    rows = capsys.readouterr().out.splitlines()
+    for style in WRITING_STYLES:
+        assert sum(1 for row in rows if row.startswith(style + " ")) == 2  # Short and long sample
+    assert server.requests == []
+
+def test_live_report_sends_every_layout(stand_in, capsys):
+    server = stand_in(Reply(content="ok"))
+    assert dobby.main(["prompt-report", "--live", "--upstream", server.url, "--api-key", API_KEY]) == 0
+    
+    out = capsys.readouterr().out
+    assert out.count("    again: ") == 2 * len(WRITING_STYLES)
+    assert len(server.requests) == 3 * 2 * len(WRITING_STYLES)  # before, after and again per sample
+
+def test_live_report_needs_a_key(stand_in):
+    server = stand_in(Reply(content="unused"))
+    assert dobby.main(["prompt-report", "--live", "--upstream", server.url, "--api-key", ""]) == 2
+    assert server.requests == []
@@ -0,0 +1,87 @@
+"""Sentence cache: known sentences come from the cache, the rest go out as numbered lines"""
+import pytest
+
+from rephrase_engine import split_segments
+
+from conftest import Reply
+
+SEGMENTS = {"enabled": True, "min_segments": 2}
+
+def sent_text(request):
+    return request["messages"][-1]["content"]
+
+@pytest.mark.parametrize("text", [
+    "One sentence. Another one!  And a third?",
+    "Hi team,\r\n\r\n  - First bullet.\n  - Second bullet.\t\n\n1. Step one. Step two.\nThanks,",
+    "No break at all",
+    "",
+])
+def test_split_segments_round_trips_exactly(text):
+    assert "".join(segment + separator for segment, separator in split_segments(text)) == text
+
+def test_split_segments_breaks_at_sentences_and_lines():
+    assert split_segments("One. Two!\n- Three") == [("One.", " "), ("Two!", "\n"), ("- Three", "")]
+
+def test_known_sentences_come_from_the_cache(stand_in, make_engine):
+    server = stand_in(Reply(content="[1] Got milk.\n[2] Phoned Bob."), Reply(content="[1] Paid rent!"))
+    engine = make_engine(server.url, network={"stream": False}, segment_settings=SEGMENTS)
+    
+    assert engine.rephrase("- Buy milk.\n- Call Bob.", "friendly") == "- Got milk.\n- Phoned Bob."
+    assert engine.rephrase("- Buy milk.\n  * Pay rent! Call Bob.", "friendly") == "- Got milk.\n  * Paid rent! Phoned Bob."
+    
+    assert len(server.requests) == 2
+    second = sent_text(server.requests[1])
+    assert "[1] Pay rent!" in second
+    assert "Buy milk" not in second and "Call Bob" not in second and "[2]" not in second
+    stats = engine.segment_stats
+    assert (stats.hits, stats.segments, stats.requests, stats.fallbacks) == (2, 5, 2, 0)
+
+def test_all_known_sentences_send_nothing(stand_in, make_engine):
+    server = stand_in(Reply(content="[1] Hello.\n[2] Bye."))
+    engine = make_engine(server.url, network={"stream": False}, segment_settings=SEGMENTS)
+    engine.rephrase("Hi. Goodbye.", "friendly")
+    assert engine.rephrase("Goodbye.\n\nHi.", "friendly") == "Bye.\n\nHello."
+    assert len(server.requests) == 1
+
+@pytest.mark.parametrize("reply", [
+    "[1] Hello.",                       # A number missing
+    "[1] Hello.\n[2] Bye.\n[3] Extra.",  # One too many
+    "[1] Hello.\n[2] ",                 # An empty line
+    "Hello. Bye.",                      # No numbers at all
+])
+def test_reply_without_the_numbering_falls_back_to_the_whole_text(stand_in, make_engine, reply):
+    server = stand_in(Reply(content=reply), Reply(content="Whole text."))
+    engine = make_engine(server.url, network={"stream": False}, segment_settings=SEGMENTS)
+    
+    assert engine.rephrase("Hi. Goodbye.", "friendly") == "Whole text."
+    assert len(server.requests) == 2
+    assert not sent_text(server.requests[1]).startswith("[1]") and "numbered lines" not in sent_text(server.requests[1])
+    assert engine.cache.get(engine.segment_key("Hi.", "friendly")) is None
+    assert engine.segment_stats.fallbacks == 1
+
+def test_cut_off_reply_falls_back_to_the_whole_text(stand_in, make_engine):
+    cut_off = Reply(content="[1] Hello.", finish_reason="length")
+    server = stand_in(cut_off, cut_off, Reply(content="Whole text."))
+    engine = make_engine(server.url, network={"stream": False}, segment_settings=SEGMENTS)
+    
+    assert engine.rephrase("Hi. Goodbye.", "friendly") == "Whole text."
+    assert len(server.requests) == 3  # Cut off, cut off with the full budget, the whole text
+    assert engine.cache.get(engine.segment_key("Hi.", "friendly")) is None
+    assert engine.segment_stats.fallbacks == 1
+
+def test_bypass_cache_sends_every_sentence_and_caches_the_new_ones(stand_in, make_engine):
+    server = stand_in(Reply(content="[1] Hello.\n[2] Bye."), Reply(content="[1] Hey there.\n[2] See you."))
+    engine = make_engine(server.url, network={"stream": False}, segment_settings=SEGMENTS)
+    engine.rephrase("Hi. Goodbye.", "friendly")
+    
+    assert engine.rephrase("Hi. Goodbye.", "friendly", bypass_cache=True) == "Hey there. See you."
+    assert "[1] Hi.\n[2] Goodbye." in sent_text(server.requests[1])
+    assert engine.cache.get(engine.segment_key("Hi.", "friendly")) == "Hey there."
+    assert engine.rephrase("Goodbye. Hi.", "friendly") == "See you. Hey there."
+    assert len(server.requests) == 2
+
+def test_short_texts_are_rephrased_whole(stand_in, make_engine):
+    server = stand_in(Reply(content="Hello."))
+    engine = make_engine(server.url, network={"stream": False}, segment_settings=SEGMENTS)
+    assert engine.rephrase("Hi.", "friendly") == "Hello."
+    assert "[1]" not in sent_text(server.requests[0])
@@ -0,0 +1,114 @@
+"""python -m dobby serve: the local HTTP service in front of one shared engine"""
+import json
+import threading
+
+import pytest
+import requests
+
+from dobby import RephraseServer
+
+from conftest import Reply, serve
+
+@pytest.fixture
+def dobby_server(make_engine):
+    """dobby_server(upstream_url) - a RephraseServer on a free port; returns its base URL"""
+    servers = []
+    
+    def start(upstream_url, **network):
+        servers.append(serve(RephraseServer(("127.0.0.1", 0), make_engine(upstream_url, network=network))))
+        return f"http://127.0.0.1:{servers[-1].server_address[1]}"
+    
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def read_events(response):
+    return [line[len("data: "):] for line in response.iter_lines(decode_unicode=True) if line.startswith("data: ")]
+
+def test_identical_concurrent_requests_share_one_upstream_call(stand_in, dobby_server):
+    upstream = stand_in(Reply(content="Shared reply", delay=0.3))
+    url = dobby_server(upstream.url)
+    results = []
+    
+    def post():
+        results.append(requests.post(f"{url}/rephrase", json={"text": "hey there", "style": "friendly"}, timeout=5))
+    
+    threads = [threading.Thread(target=post) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert [response.status_code for response in results] == [200] * 5
+    assert all(response.json() == {"text": "Shared reply", "style": "friendly"} for response in results)
+    assert len(upstream.requests) == 1
+
+def test_stream_sends_deltas_then_the_text_then_done(stand_in, dobby_server):
+    upstream = stand_in(Reply(deltas=["Hello ", "there, ", "friend"], delta_delay=0.02))
+    url = dobby_server(upstream.url)
+    
+    with requests.post(f"{url}/rephrase/stream", json={"text": "hi", "style": "friendly"}, stream=True, timeout=5) as response:
+        assert response.status_code == 200
+        assert response.headers["Content-Type"].startswith("text/event-stream")
+        events = read_events(response)
+    
+    assert events[-1] == "[DONE]"
+    bodies = [json.loads(event) for event in events[:-1]]
+    assert bodies[-1] == {"text": "Hello there, friend", "style": "friendly"}
+    deltas = [body["delta"] for body in bodies[:-1]]
+    assert deltas and all(set(body) == {"delta"} for body in bodies[:-1])
+    assert "".join(deltas).strip() == "Hello there, friend"
+
+def test_stream_of_a_cached_text_arrives_in_one_piece(stand_in, dobby_server):
+    upstream = stand_in(Reply(deltas=["Hello ", "there"]))
+    url = dobby_server(upstream.url)
+    for _ in range(2):
+        with requests.post(f"{url}/rephrase/stream", json={"text": "hi"}, stream=True, timeout=5) as response:
+            events = read_events(response)
+    
+    assert [json.loads(event) for event in events[:-1]] == [{"delta": "Hello there"},
+                                                           {"text": "Hello there", "style": "friendly"}]
+    assert len(upstream.requests) == 1
+
+@pytest.mark.parametrize("route", ["/rephrase", "/rephrase/stream"])
+@pytest.mark.parametrize("body, error", [
+    (b"{not json", "Body must be JSON"),
+    (b'{"style": "friendly"}', '"text" is required'),
+    (b'{"text": "   "}', '"text" is required'),
+    (b'["hey"]', '"text" is required'),
+    (b'{"text": "hey", "style": "no such style"}', "Unknown style"),
+])
+def test_bad_requests_get_400(stand_in, dobby_server, route, body, error):
+    upstream = stand_in(Reply(content="unused"))
+    url = dobby_server(upstream.url)
+    
+    response = requests.post(f"{url}{route}", data=body, headers={"Content-Type": "application/json"}, timeout=5)
+    assert response.status_code == 400
+    assert response.json()["error"].startswith(error)
+    assert upstream.requests == []
+
+def test_rejected_requests_stay_out_of_the_rephrase_latency(stand_in, dobby_server):
+    upstream = stand_in(Reply(content="ok"))
+    url = dobby_server(upstream.url, stream=False)
+    for text in ("one", "two"):
+        assert requests.post(f"{url}/rephrase", json={"text": text}, timeout=5).status_code == 200
+    for body in ({"text": ""}, {"text": "three", "style": "nope"}, {}):
+        assert requests.post(f"{url}/rephrase", json=body, timeout=5).status_code == 400
+    
+    routes = requests.get(f"{url}/stats", timeout=5).json()["routes"]
+    assert routes["POST /rephrase"]["count"] == 2
+    assert routes["POST /rephrase (400)"]["count"] == 3
+
+def test_upstream_errors_are_502(stand_in, dobby_server):
+    upstream = stand_in(Reply(status=401))
+    url = dobby_server(upstream.url, stream=False)
+    response = requests.post(f"{url}/rephrase", json={"text": "hey"}, timeout=5)
+    assert response.status_code == 502
+    assert "error" in response.json()
+
+def test_styles_and_unknown_routes(stand_in, dobby_server):
+    url = dobby_server(stand_in(Reply(content="unused")).url)
+    assert "friendly" in requests.get(f"{url}/styles", timeout=5).json()
+    assert requests.get(f"{url}/nothing", timeout=5).status_code == 404
+    assert requests.post(f"{url}/nothing", json={}, timeout=5).status_code == 404
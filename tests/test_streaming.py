@@ -0,0 +1,53 @@
+"""Streaming (SSE) replies and the fallback to a regular request"""
+from rephrase_engine import iter_sse_deltas, CompletionStats, Generation
+
+from conftest import Reply
+
+def test_iter_sse_deltas_yields_content_until_done():
+    lines = [
+        ": keep-alive comment",
+        "",
+        'data: {"choices": [{"delta": {"role": "assistant"}}]}',
+        'data: {"choices": [{"delta": {"content": "Hello"}, "finish_reason": null}]}',
+        'data: {"choices": [{"delta": {"content": " there"}, "finish_reason": null}]}',
+        'data: {"choices": [{"delta": {}, "finish_reason": "length"}]}',
+        "data: [DONE]",
+        'data: {"choices": [{"delta": {"content": "after done"}}]}',
+    ]
+    stats = CompletionStats()
+    assert list(iter_sse_deltas(lines, stats)) == ["Hello", " there"]
+    assert (stats.completions, stats.budget_hits) == (1, 1)
+
+def test_stream_completion_batches_deltas(stand_in, make_engine):
+    server = stand_in(Reply(deltas=["Hi ", "there ", "friend"]))
+    engine = make_engine(server.url)
+    received = []
+    text = engine.stream_completion(engine.build_payload("hey", "friendly"), Generation(), received.append)
+    assert text == "Hi there friend"
+    assert "".join(received) == "Hi there friend"
+    assert server.requests[0]["stream"] is True
+
+def test_rephrase_streams_from_mock(mock_url, make_engine):
+    engine = make_engine(mock_url)
+    received = []
+    text = engine.rephrase("hello how are you", "friendly", on_delta=received.append)
+    assert text == "Rephrased: hello how are you"
+    assert "".join(received).strip() == text
+
+def test_falls_back_to_regular_request_when_stream_fails(stand_in, make_engine):
+    server = stand_in(Reply(status=404), Reply(content="Regular reply"))
+    engine = make_engine(server.url)
+    assert engine.rephrase("hey", "friendly") == "Regular reply"
+    assert [request.get("stream") for request in server.requests] == [True, None]
+
+def test_json_reply_to_stream_request(stand_in, make_engine):
+    server = stand_in(Reply(content="Not streamed"))
+    engine = make_engine(server.url)
+    assert engine.rephrase("hey", "friendly", on_delta=lambda delta: None) == "Not streamed"
+    assert len(server.requests) == 1
+
+def test_stream_disabled_sends_regular_request(stand_in, make_engine):
+    server = stand_in(Reply(content="Regular reply"))
+    engine = make_engine(server.url, network={"stream": False})
+    assert engine.rephrase("hey", "friendly") == "Regular reply"
+    assert "stream" not in server.requests[0]
@@ -0,0 +1,61 @@
+"""DobbyRephraser against a stand-in endpoint - needs the GUI dependencies, runs offscreen"""
+import os
+import time
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+for module in ("PyQt6", "pyperclip", "pyautogui", "pynput"):
+    pytest.importorskip(module)
+
+from PyQt6.QtWidgets import QApplication, QMessageBox
+
+import dobby_qt
+
+from conftest import Reply
+
+@pytest.fixture
+def window(monkeypatch):
+    app = QApplication.instance() or QApplication([])
+    errors = []
+    monkeypatch.setattr(QMessageBox, "critical", lambda parent, title, text: errors.append(text))
+    windows = []
+    
+    def make(engine):
+        windows.append(dobby_qt.DobbyRephraser(engine=engine, clipboard=object(), injector=object()))
+        pump(app, 0.2)  # Let the startup layout pass run before the test sets any text
+        return windows[-1]
+    
+    make.app = app
+    make.errors = errors
+    yield make
+    for window in windows:
+        window.preview_timer.stop()
+        window.deleteLater()
+    app.processEvents()
+
+def pump(app, seconds):
+    until = time.monotonic() + seconds
+    while time.monotonic() < until:
+        app.processEvents()
+        time.sleep(0.01)
+
+def test_prefetch_answered_from_cache_is_shown(stand_in, make_engine, window, monkeypatch):
+    server = stand_in(Reply(deltas=["Cached ", "reply"]))
+    engine = make_engine(server.url)
+    assert engine.rephrase("some text here", "friendly") == "Cached reply"
+    monkeypatch.setitem(dobby_qt.PREFETCH_SETTINGS, "enabled", True)
+    
+    rephraser = window(engine)
+    rephraser.selected_style = "friendly"
+    rephraser.show_with_text("some text here")
+    until = time.monotonic() + 5
+    while rephraser.prefetch.result is None and rephraser.prefetch.error is None and time.monotonic() < until:
+        pump(window.app, 0.02)
+    
+    assert rephraser.prefetch.error is None
+    assert rephraser.prefetch.generation.from_cache
+    rephraser.start_generation()
+    assert rephraser.result_text.toPlainText() == "Cached reply"
+    assert window.errors == []
+    assert len(server.requests) == 1